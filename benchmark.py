@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import string
+import argparse
+import platform
+import tempfile
+from ngram_core import parse_srt, extract_ngrams, save_detailed_output, save_plain_output, WORD_PATTERN
+from ngram_query import QueryEngine, tokenize_query
+
+BENCHMARK_VERSION = 1
+DETAILED_FORMATS = ["JSON", "TXT", "NGI"]
+VIDEO_FPS = 25
+
+# --- Synthetic Corpus ---
+def make_vocabulary(size, rng):
+    """
+    Returns size distinct pseudo-words of 2 to 9 letters.
+    """
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))))
+    return sorted(words)
+
+def seconds_to_srt_time(seconds):
+    ms = int(round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+def generate_srt(path, blocks, vocabulary, weights, rng, max_words=12):
+    """
+    Writes an SRT file of the given number of blocks. Words follow a Zipf-like distribution
+    (cumulative weights), so frequent ngrams repeat across blocks and files as in real subtitles.
+    """
+    t = 1.0
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(1, blocks + 1):
+            duration = rng.uniform(1.0, 4.0)
+            words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(2, max_words))
+            f.write(f"{i}\n{seconds_to_srt_time(t)} --> {seconds_to_srt_time(t + duration)}\n"
+                    f"{' '.join(words).capitalize()}.\n\n")
+            t += duration + rng.uniform(0.1, 1.5)
+    return t
+
+def generate_corpus(folder, files, blocks, vocab_size, seed=0):
+    """
+    Generates files synthetic SRT files in folder and returns [(path, duration in seconds)].
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocab_size, rng)
+    weights = []
+    total = 0.0
+    for rank in range(1, vocab_size + 1):
+        total += 1.0 / rank
+        weights.append(total)
+    os.makedirs(folder, exist_ok=True)
+    corpus = []
+    for n in range(files):
+        path = os.path.join(folder, f"bench{n:04d}.srt")
+        corpus.append((path, generate_srt(path, blocks, vocabulary, weights, rng)))
+    return corpus
+
+def generate_video(path, duration, size="320x240", fps=VIDEO_FPS):
+    """
+    Writes a synthetic H.264/AAC test video (test pattern and a sine tone) with ffmpeg.
+    """
+    from video_cutter import run_ffmpeg
+    run_ffmpeg(["-f", "lavfi", "-i", f"testsrc2=size={size}:rate={fps}:duration={duration:.3f}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration:.3f}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-g", str(fps * 2), "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-shortest", path])
+    return path
+
+def make_queries(subtitles_by_file, count, rng):
+    """
+    Query sentences: half are spans of real subtitle text (mostly found), half are shuffled
+    words (mostly NOT FOUND), so both search paths are measured.
+    """
+    texts = [text for subtitles in subtitles_by_file for _start, _end, text in subtitles]
+    queries = []
+    for i in range(count):
+        words = WORD_PATTERN.findall(rng.choice(texts))
+        if i % 2:
+            rng.shuffle(words)
+        queries.append(" ".join(words))
+    return queries
+
+# --- Timing ---
+def time_stage(func, repeat, items=None):
+    """
+    Runs func repeat times and returns its timings; the best run is used for rates.
+    """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    stage = {"seconds": min(runs), "mean": sum(runs) / len(runs), "runs": runs}
+    if items is not None:
+        stage["items"] = items
+        stage["per_second"] = items / min(runs) if min(runs) > 0 else None
+    return stage
+
+# --- Stages ---
+def run_benchmark(work_dir, files=20, blocks=500, vocab_size=5000, queries=200, repeat=3, seed=0,
+                  videos=True, cut_mode="copy", log=print):
+    results = {"stages": {}, "skipped": {}}
+    stages = results["stages"]
+    rng = random.Random(seed)
+
+    srt_dir = os.path.join(work_dir, "srt")
+    corpus = generate_corpus(srt_dir, files, blocks, vocab_size, seed)
+    contents = []
+    for path, _duration in corpus:
+        with open(path, 'r', encoding='utf-8') as f:
+            contents.append(f.read())
+    log(f"Generated {files} SRT file(s) of {blocks} block(s).")
+
+    stages["parse_srt"] = time_stage(lambda: [parse_srt(content) for content in contents], repeat,
+                                     items=files * blocks)
+    subtitles_by_file = [parse_srt(content) for content in contents]
+    stages["extract_ngrams"] = time_stage(lambda: [extract_ngrams(subtitles) for subtitles in subtitles_by_file],
+                                          repeat, items=files * blocks)
+    stages["extract_ngrams_compact"] = time_stage(
+        lambda: [extract_ngrams(subtitles, compact=True) for subtitles in subtitles_by_file], repeat,
+        items=files * blocks)
+    ngram_dicts = [extract_ngrams(subtitles) for subtitles in subtitles_by_file]
+    ngram_count = sum(len(ngram_dict) for ngram_dict in ngram_dicts)
+    results["ngrams"] = ngram_count
+    log(f"Timed parsing and extraction ({ngram_count} ngrams).")
+
+    base_names = [os.path.splitext(os.path.basename(path))[0] for path, _duration in corpus]
+    detailed_paths = {}
+    for output_format in DETAILED_FORMATS:
+        out_dir = os.path.join(work_dir, "out_" + output_format.lower())
+        os.makedirs(out_dir, exist_ok=True)
+        save_all = lambda: [save_detailed_output(ngram_dict, out_dir, base, output_format)
+                            for ngram_dict, base in zip(ngram_dicts, base_names)]
+        stages[f"save_detailed_{output_format.lower()}"] = time_stage(save_all, repeat, items=ngram_count)
+        detailed_paths[output_format] = save_all()
+    plain_dir = os.path.join(work_dir, "out_plain")
+    os.makedirs(plain_dir, exist_ok=True)
+    stages["save_plain"] = time_stage(lambda: [save_plain_output(ngram_dict, plain_dir, base)
+                                               for ngram_dict, base in zip(ngram_dicts, base_names)],
+                                      repeat, items=ngram_count)
+    log("Timed serialization.")
+
+    # load_output_files: what the NGram Query tab does for every selected file.
+    engine = None
+    for output_format, paths in detailed_paths.items():
+        def load_all():
+            loaded = QueryEngine()
+            for path in paths:
+                loaded.load_file(path, compact=True)
+            return loaded
+        stages[f"load_output_files_{output_format.lower()}"] = time_stage(load_all, repeat, items=files)
+        if output_format == "JSON":
+            engine = load_all()
+
+    # search_ngrams: the lookup memo is cleared so every repeat measures cold lookups.
+    sentences = make_queries(subtitles_by_file, queries, rng)
+    word_lists = [tokenize_query(sentence) for sentence in sentences]
+    search_results = []
+    for name, segment in (("search_ngrams_greedy", engine.segment_greedy),
+                          ("search_ngrams_optimal", engine.segment_optimal)):
+        def search_all():
+            engine.clear_memo()
+            return [segment(words) for words in word_lists]
+        stages[name] = time_stage(search_all, repeat, items=queries)
+        if not search_results:
+            search_results = search_all()
+    log("Timed loading and searching.")
+
+    if videos:
+        try:
+            run_cutting_stage(work_dir, corpus, base_names, search_results, cut_mode, repeat, stages)
+            log("Timed cutting.")
+        except (ImportError, RuntimeError, OSError) as e:
+            results["skipped"]["process_cutting"] = str(e)
+            log(f"Cutting skipped: {e}")
+    else:
+        results["skipped"]["process_cutting"] = "disabled"
+    for engine_file in engine.filenames:
+        engine.remove_file(engine_file)
+    return results
+
+def run_cutting_stage(work_dir, corpus, base_names, search_results, cut_mode, repeat, stages):
+    """
+    process_cutting: plans and cuts the clips of the first query's matches from synthetic
+    videos as long as the SRT files.
+    """
+    from video_cutter import CutScheduler, plan_cut_tasks, plan_spans
+    video_dir = os.path.join(work_dir, "videos")
+    os.makedirs(video_dir, exist_ok=True)
+    video_files = {}
+    for (_path, duration), base in zip(corpus, base_names):
+        video_files[base] = generate_video(os.path.join(video_dir, base + ".mp4"), duration)
+    query_output = next((results for results in search_results if any(res["found"] for res in results)), [])
+    # Detailed outputs are named "<base>_detailed.json"; match them to "<base>.mp4".
+    for res in query_output:
+        res["matches"] = [(fname.replace("_detailed", ""), times) for fname, times in res["matches"]]
+
+    clips_dir = os.path.join(work_dir, "clips")
+    def cut_all():
+        shutil.rmtree(clips_dir, ignore_errors=True)
+        os.makedirs(clips_dir)
+        groups, _missing = plan_cut_tasks(query_output, video_files)
+        spans, stats = plan_spans(groups)
+        failed = CutScheduler(clips_dir, cut_mode, max_workers=os.cpu_count() or 1).run(spans)
+        if failed:
+            raise RuntimeError(f"{failed} clip(s) failed to cut")
+        return stats
+    stats = cut_all()
+    stage = time_stage(cut_all, repeat, items=stats["clips"])
+    # Throughput in source frames decoded per second.
+    stage["encode_fps"] = stats["span_seconds"] * VIDEO_FPS / stage["seconds"] if stage["seconds"] > 0 else None
+    stage["mode"] = cut_mode
+    stages["process_cutting"] = stage
+
+# --- Comparison ---
+def compare_results(baseline, current):
+    """
+    Returns [(stage, baseline seconds, current seconds, ratio)] for the stages both runs timed.
+    """
+    rows = []
+    for name, stage in current["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if old:
+            rows.append((name, old["seconds"], stage["seconds"],
+                         stage["seconds"] / old["seconds"] if old["seconds"] else None))
+    return rows
+
+# --- Command Line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the ngram pipeline on a synthetic corpus "
+                                                 "and writes the timings as JSON.")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--files", type=int, default=20, help="number of synthetic SRT files (default: 20)")
+    parser.add_argument("--blocks", type=int, default=500, help="subtitle blocks per file (default: 500)")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="distinct words (default: 5000)")
+    parser.add_argument("--queries", type=int, default=200, help="query sentences to search (default: 200)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the corpus (default: 0)")
+    parser.add_argument("--no-video", action="store_true", help="skip the video generation and cutting stage")
+    parser.add_argument("--cut-mode", choices=["copy", "smart", "reencode"], default="copy",
+                        help="cutting mode of the process_cutting stage (default: copy)")
+    parser.add_argument("--work-dir", default=None, help="keep the generated corpus in this folder")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",
+                        help="earlier results file to compare the timings against")
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ngram_bench_")
+    try:
+        results = run_benchmark(work_dir, args.files, args.blocks, args.vocabulary, args.queries,
+                                max(1, args.repeat), args.seed, not args.no_video, args.cut_mode,
+                                log=lambda message: print(message, file=sys.stderr))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    results.update({
+        "version": BENCHMARK_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"files": args.files, "blocks": args.blocks, "vocabulary": args.vocabulary,
+                   "queries": args.queries, "repeat": args.repeat, "seed": args.seed}
+    })
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    for name, stage in results["stages"].items():
+        rate = f", {stage['per_second']:.0f}/s" if stage.get("per_second") else ""
+        print(f"{name:32} {stage['seconds'] * 1000:10.1f} ms{rate}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:")
+        for name, old, new, ratio in compare_results(baseline, results):
+            change = f"x{ratio:.2f}" if ratio is not None else ""
+            print(f"{name:32} {old * 1000:10.1f} ms -> {new * 1000:10.1f} ms  {change}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+
+CACHE_FILENAME = ".build_cache.json"
+CACHE_VERSION = 1
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file's content, read in 1 MB chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_signature(path):
+    """
+    Returns (size, mtime in ns) of a file, used to avoid re-hashing untouched sources.
+    """
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+class BuildCache:
+    """
+    Persistent record of which SRT sources were already turned into outputs.
+    Stored as ".build_cache.json" in the output folder; every entry holds the source's
+    content hash, its size/mtime, the options used (lowercase, format, ...) and the names
+    of the outputs written for it. A source is fresh when its content and options are
+    unchanged and all required outputs still exist.
+    An output file belongs to one source only: recording it for a source removes it from
+    the entry of the source that wrote it before, which is then rebuilt on the next run.
+    """
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, CACHE_FILENAME)
+        self.entries = {}
+        self._dirty = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data.get("sources", {})
+        except (OSError, ValueError):
+            # A missing or unreadable cache only means everything is rebuilt.
+            self.entries = {}
+        self._owners = {}  # {output name: source key}
+        claimed = set()
+        for key, entry in self.entries.items():
+            for output in entry.get("outputs", {}).values():
+                if output in self._owners:
+                    claimed.add(output)
+                self._owners[output] = key
+        for output in claimed:
+            # Written by several sources (older caches); none of them can be trusted.
+            for entry in self.entries.values():
+                outputs = entry.get("outputs", {})
+                for kind in [kind for kind, name in outputs.items() if name == output]:
+                    del outputs[kind]
+            del self._owners[output]
+            self._dirty = True
+
+    @staticmethod
+    def key(source_path):
+        return os.path.abspath(source_path)
+
+    def _outputs_exist(self, entry, required_outputs):
+        outputs = entry.get("outputs", {})
+        return all(kind in outputs and os.path.exists(os.path.join(self.output_folder, outputs[kind]))
+                   for kind in required_outputs)
+
+    def candidate_digest(self, source_path, options, required_outputs):
+        """
+        Returns the recorded digest if the entry matches the options and its outputs exist,
+        i.e. the source only has to be re-hashed to decide whether it can be skipped.
+        """
+        entry = self.entries.get(self.key(source_path))
+        if entry is None or entry.get("options") != options:
+            return None
+        if not self._outputs_exist(entry, required_outputs):
+            return None
+        return entry.get("sha256")
+
+    def is_unchanged(self, source_path, options, required_outputs):
+        """
+        Cheap check: True when size and mtime still match a valid entry, so no hashing is needed.
+        """
+        if self.candidate_digest(source_path, options, required_outputs) is None:
+            return False
+        entry = self.entries[self.key(source_path)]
+        try:
+            return list(file_signature(source_path)) == entry.get("signature")
+        except OSError:
+            return False
+
+    def is_fresh(self, source_path, options, required_outputs, digest=None):
+        """
+        Full check by content hash; returns (fresh, digest).
+        """
+        digest = digest or file_digest(source_path)
+        return self.candidate_digest(source_path, options, required_outputs) == digest, digest
+
+    def record(self, source_path, digest, options, outputs):
+        """
+        Records outputs {kind: path} written for a source. Outputs of an entry with the same
+        content and options are kept, so detailed and plain outputs can be saved separately.
+        """
+        key = self.key(source_path)
+        entry = self.entries.get(key)
+        if entry is None or entry.get("sha256") != digest or entry.get("options") != options:
+            entry = {"sha256": digest, "options": options, "outputs": {}}
+            self.entries[key] = entry
+        try:
+            entry["signature"] = list(file_signature(source_path))
+        except OSError:
+            entry["signature"] = None
+        for kind, output_path in outputs.items():
+            output = os.path.relpath(output_path, self.output_folder)
+            owner = self._owners.get(output)
+            if owner is not None and owner != key and owner in self.entries:
+                previous = self.entries[owner]["outputs"]
+                for old_kind in [old_kind for old_kind, name in previous.items() if name == output]:
+                    del previous[old_kind]
+            self._owners[output] = key
+            entry["outputs"][kind] = output
+        self._dirty = True
+
+    def touch(self, source_path):
+        """
+        Refreshes the stored size/mtime of a source whose content turned out to be unchanged.
+        """
+        entry = self.entries.get(self.key(source_path))
+        if entry is not None:
+            try:
+                entry["signature"] = list(file_signature(source_path))
+                self._dirty = True
+            except OSError:
+                pass
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.output_folder, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": CACHE_VERSION, "sources": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
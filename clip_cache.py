@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ngram_video_cutter", "clips")
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+INDEX_FILENAME = "index.json"
+FINGERPRINT_BLOCK = 1 << 20
+
+def source_fingerprint(video_path):
+    """
+    Fingerprints a source video by its size and the SHA-256 of its first and last megabyte.
+    Cheap even for multi-GB masters, and independent of the file's name or location.
+    """
+    size = os.path.getsize(video_path)
+    digest = hashlib.sha256(str(size).encode("ascii"))
+    with open(video_path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BLOCK))
+        if size > FINGERPRINT_BLOCK:
+            f.seek(max(FINGERPRINT_BLOCK, size - FINGERPRINT_BLOCK))
+            digest.update(f.read(FINGERPRINT_BLOCK))
+    return digest.hexdigest()
+
+def place_file(source_path, target_path):
+    """
+    Hardlinks source_path to target_path, copying when linking is not possible.
+    """
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+class ClipCache:
+    """
+    Content-addressed cache of cut clips shared by all output folders.
+    Clips are keyed on the source fingerprint, start, end and the cut settings (mode,
+    codecs), stored as "<key>.mp4" in the cache folder, and evicted least recently used
+    first once the folder exceeds max_bytes. Safe to use from several worker threads.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("NGRAM_CLIP_CACHE") or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._fingerprints = {}  # {(path, size, mtime_ns): fingerprint}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)  # {key: {"size": bytes, "last_used": unix time}}
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def fingerprint(self, video_path):
+        st = os.stat(video_path)
+        memo_key = (os.path.abspath(video_path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            fingerprint = self._fingerprints.get(memo_key)
+        if fingerprint is None:
+            fingerprint = source_fingerprint(video_path)
+            with self._lock:
+                self._fingerprints[memo_key] = fingerprint
+        return fingerprint
+
+    @staticmethod
+    def key(fingerprint, start_time, end_time, settings):
+        payload = json.dumps([fingerprint, round(start_time, 3), round(end_time, 3), settings], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _clip_path(self, key):
+        return os.path.join(self.cache_dir, key + ".mp4")
+
+    def get(self, key, target_path):
+        """
+        Places the cached clip at target_path and returns True, or returns False on a miss.
+        """
+        clip_path = self._clip_path(key)
+        with self._lock:
+            if key not in self.entries:
+                return False
+            if not os.path.exists(clip_path):
+                del self.entries[key]
+                return False
+            self.entries[key]["last_used"] = time.time()
+        place_file(clip_path, target_path)
+        return True
+
+    def put(self, key, clip_file):
+        """
+        Stores a freshly cut clip and evicts the least recently used clips over the budget.
+        """
+        clip_path = self._clip_path(key)
+        tmp_path = f"{clip_path}.{threading.get_ident()}.tmp"
+        place_file(clip_file, tmp_path)
+        os.replace(tmp_path, clip_path)
+        with self._lock:
+            self.entries[key] = {"size": os.path.getsize(clip_path), "last_used": time.time()}
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)["size"]
+            try:
+                os.remove(self._clip_path(key))
+            except OSError:
+                pass
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
@@ -0,0 +1,209 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+# Packed keys hold up to three token ids of 21 bits each (id + 1, so 0 marks "no token").
+TOKEN_BITS = 21
+TOKEN_MASK = (1 << TOKEN_BITS) - 1
+MAX_TOKENS = TOKEN_MASK - 1
+
+class TokenTable:
+    """
+    Interns tokens to small integer ids.
+    """
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+
+    def intern(self, token):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            if token_id > MAX_TOKENS:
+                raise ValueError(f"Vocabulary exceeds {MAX_TOKENS + 1} distinct tokens")
+            self.ids[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def get(self, token):
+        return self.ids.get(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+def pack_ids(ids):
+    """
+    Packs 2 or 3 token ids into a single 64-bit integer key.
+    """
+    key = 0
+    for shift, token_id in enumerate(ids):
+        key |= (token_id + 1) << (shift * TOKEN_BITS)
+    return key
+
+def gram_key(tokens, gram):
+    """
+    Returns the packed key of a "word word [word]" ngram, or None when no dictionary built
+    on the token table can contain it.
+    """
+    parts = gram.split(" ")
+    if not 2 <= len(parts) <= 3:
+        return None
+    ids = []
+    for part in parts:
+        token_id = tokens.get(part)
+        if token_id is None:
+            return None
+        ids.append(token_id)
+    return pack_ids(ids)
+
+def unpack_gram(tokens, key):
+    """
+    Returns the ngram string of a packed key.
+    """
+    names = tokens.tokens
+    words = []
+    while key:
+        words.append(names[(key & TOKEN_MASK) - 1])
+        key >>= TOKEN_BITS
+    return " ".join(words)
+
+class CompactNGramDict(Mapping):
+    """
+    Memory-compact {ngram: [start times]} mapping.
+    Bigrams and trigrams are keyed by packed 64-bit token-id keys kept in one sorted
+    array('Q'); timestamps are uint32 milliseconds in a single array('I') addressed by an
+    offset array. Reads go through the normal dict interface (ngram strings in, lists of
+    seconds out), iterating in first-occurrence order like a plain dict, so queries and the
+    JSON/TXT/plain writers work unchanged.
+    """
+    def __init__(self, tokens=None):
+        self.tokens = tokens if tokens is not None else TokenTable()
+        self._keys = array("Q")           # sorted unique packed keys
+        self._offsets = array("Q", [0])   # postings of key i are _times[_offsets[i]:_offsets[i + 1]]
+        self._times = array("I")
+        self._order = array("I")          # key positions in first-occurrence order
+        self._pending_keys = array("Q")
+        self._pending_times = array("I")
+
+    @classmethod
+    def from_mapping(cls, mapping, tokens=None):
+        """
+        Builds a compact copy of a plain {ngram: [times]} mapping.
+        Raises ValueError for keys that are not bigrams or trigrams.
+        """
+        compact = cls(tokens)
+        intern = compact.tokens.intern
+        for gram, times in mapping.items():
+            parts = gram.split(" ")
+            if not 2 <= len(parts) <= 3:
+                raise ValueError(f"Unsupported ngram: {gram!r}")
+            key = pack_ids([intern(part) for part in parts])
+            for t in times:
+                compact._pending_keys.append(key)
+                compact._pending_times.append(int(round(t * 1000)))
+        compact._freeze()
+        return compact
+
+    def add_words(self, words, start_time):
+        """
+        Adds the bigrams and trigrams of one subtitle's words, all starting at start_time.
+        """
+        intern = self.tokens.intern
+        ids = [intern(word) + 1 for word in words]
+        ms = int(round(start_time * 1000))
+        keys = self._pending_keys
+        times = self._pending_times
+        # Bigrams:
+        for i in range(len(ids) - 1):
+            keys.append(ids[i] | (ids[i+1] << TOKEN_BITS))
+            times.append(ms)
+        # Trigrams:
+        for i in range(len(ids) - 2):
+            keys.append(ids[i] | (ids[i+1] << TOKEN_BITS) | (ids[i+2] << (2 * TOKEN_BITS)))
+            times.append(ms)
+
+    def _freeze(self):
+        """
+        Merges pending postings into the sorted arrays. Postings keep their insertion order.
+        """
+        if not self._pending_keys:
+            return
+        pending_keys, pending_times = self._pending_keys, self._pending_times
+        if self._keys:
+            # Already frozen postings are older, so they go first.
+            old_keys, old_times = array("Q"), array("I")
+            for i in self._order:
+                start, end = self._offsets[i], self._offsets[i + 1]
+                old_keys.extend([self._keys[i]] * (end - start))
+                old_times.extend(self._times[start:end])
+            old_keys.extend(pending_keys)
+            old_times.extend(pending_times)
+            pending_keys, pending_times = old_keys, old_times
+        counts = {}  # insertion order of this dict is the first-occurrence order
+        for key in pending_keys:
+            counts[key] = counts.get(key, 0) + 1
+        sorted_keys = sorted(counts)
+        position = {key: i for i, key in enumerate(sorted_keys)}
+        offsets = array("Q", [0])
+        for key in sorted_keys:
+            offsets.append(offsets[-1] + counts[key])
+        cursor = array("Q", offsets[:-1])
+        times = array("I", bytes(4 * len(pending_times)))
+        for key, t in zip(pending_keys, pending_times):
+            i = position[key]
+            times[cursor[i]] = t
+            cursor[i] += 1
+        self._keys = array("Q", sorted_keys)
+        self._offsets = offsets
+        self._times = times
+        self._order = array("I", [position[key] for key in counts])
+        self._pending_keys = array("Q")
+        self._pending_times = array("I")
+
+    def _find(self, gram):
+        key = gram_key(self.tokens, gram) if isinstance(gram, str) else None
+        if key is None:
+            return -1
+        self._freeze()
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return -1
+
+    def _gram_at(self, i):
+        return unpack_gram(self.tokens, self._keys[i])
+
+    def packed_keys(self):
+        """
+        The sorted packed keys of the dictionary, as an array('Q') that must not be modified.
+        """
+        self._freeze()
+        return self._keys
+
+    def __getitem__(self, gram):
+        i = self._find(gram)
+        if i < 0:
+            raise KeyError(gram)
+        return [ms / 1000 for ms in self._times[self._offsets[i]:self._offsets[i + 1]]]
+
+    def __contains__(self, gram):
+        return self._find(gram) >= 0
+
+    def __len__(self):
+        self._freeze()
+        return len(self._keys)
+
+    def __iter__(self):
+        self._freeze()
+        for i in self._order:
+            yield self._gram_at(i)
+
+    def to_dict(self):
+        return {gram: self[gram] for gram in self}
+
+    def nbytes(self):
+        """
+        Approximate size of the packed arrays in bytes (the shared token table is not included).
+        """
+        self._freeze()
+        return sum(a.itemsize * len(a) for a in (self._keys, self._offsets, self._times, self._order))
@@ -0,0 +1,236 @@
+import os
+import shutil
+import tempfile
+from ngram_core import iter_srt_file
+from video_cutter import (MODE_COPY, MODE_SMART, MODE_REENCODE, CLIP_LENGTH, run_ffmpeg, video_codec,
+                          video_stream, video_frame_rate, video_timescale, smart_cut_incompatibility,
+                          matching_encode_args, cut_copy, cut_smart, concat_copy)
+from video_index import load_video_index
+
+# --- Compilation ---
+# One output video that "speaks" the query: one hit per found query_results entry, in
+# query order, each running from its subtitle's start to the subtitle's real end time.
+# Segments are smart cut (see cut_smart) and joined with the concat demuxer. The first
+# segment's source is the target format: only segments from sources that differ from it
+# in codec parameters are re-encoded, to the target's parameters, so they join the others
+# without re-encoding those.
+AUDIO_RATE = 48000
+
+def find_subtitle_file(video_path):
+    """
+    Returns the "<base>.srt" next to a video (any case of the extension), or None.
+    """
+    folder = os.path.dirname(video_path) or "."
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return None
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if stem == base and ext.lower() == ".srt":
+            return os.path.join(folder, name)
+    return None
+
+def subtitle_end_times(srt_path):
+    """
+    Returns {start time in ms: end time in seconds} of every subtitle block.
+    """
+    end_times = {}
+    for start_time, end_time, _text in iter_srt_file(srt_path):
+        key = int(round(start_time * 1000))
+        end_times[key] = max(end_time, end_times.get(key, 0.0))
+    return end_times
+
+def plan_compilation(query_output, video_files, clip_length=CLIP_LENGTH):
+    """
+    Picks one hit per found entry, in query order, and returns (segments, skipped).
+    A segment is a dict with video_path, start, end, ngram and index; its end is the end
+    time of the matched subtitle, read from the SRT next to the video, or start + clip_length
+    when there is none. skipped lists the ngrams without a hit in a loaded video.
+    """
+    segments = []
+    skipped = []
+    end_times = {}  # {video_path: {start ms: end}}
+    for idx, entry in enumerate(query_output):
+        hit = None
+        if entry["found"]:
+            for fname, times in entry["matches"]:
+                base = os.path.splitext(fname)[0]
+                if base in video_files and times:
+                    hit = (video_files[base], times[0])
+                    break
+        if hit is None:
+            skipped.append(entry["ngram"])
+            continue
+        video_path, start_time = hit
+        if video_path not in end_times:
+            srt_path = find_subtitle_file(video_path)
+            try:
+                end_times[video_path] = subtitle_end_times(srt_path) if srt_path else {}
+            except OSError:
+                end_times[video_path] = {}
+        end_time = end_times[video_path].get(int(round(start_time * 1000)))
+        if end_time is None or end_time <= start_time:
+            end_time = start_time + clip_length
+        segments.append({"video_path": video_path, "start": start_time, "end": end_time,
+                         "ngram": entry["ngram"], "index": idx})
+    return segments, skipped
+
+def stream_signature(info):
+    """
+    Codec parameters that have to match for packets of different sources to be concatenated.
+    """
+    video = audio = None
+    for stream in info["streams"]:
+        if stream.get("codec_type") == "video" and video is None:
+            video = (stream.get("codec_name"), stream.get("profile"), stream.get("width"), stream.get("height"),
+                     stream.get("pix_fmt"), stream.get("r_frame_rate"))
+        elif stream.get("codec_type") == "audio" and audio is None:
+            audio = (stream.get("codec_name"), stream.get("sample_rate"), stream.get("channels"))
+    return video, audio
+
+def _video_size(info):
+    stream = video_stream(info) or {}
+    return stream.get("width"), stream.get("height")
+
+def _frame_rate_text(info):
+    """
+    Frame rate of the first video stream for the fps filter, as exact as the source states it.
+    """
+    stream = video_stream(info) or {}
+    rate = stream.get("r_frame_rate") or ""
+    num, _sep, den = rate.partition("/")
+    if num.isdigit() and int(num) > 0 and (not den or den.isdigit() and int(den) > 0):
+        return rate
+    return f"{video_frame_rate(info) or 25.0:.3f}"
+
+def target_incompatibility(info):
+    """
+    Returns why parts cannot be encoded to join stream-copied parts of this source, or None:
+    its video has to be reproducible by libx264 (see smart_cut_incompatibility) and its
+    audio, if any, has to be AAC.
+    """
+    reason = smart_cut_incompatibility(info)
+    if reason:
+        return reason
+    audio = stream_signature(info)[1]
+    if audio is not None and audio[0] != "aac":
+        return f"parts cannot be encoded to match {audio[0]} audio"
+    return None
+
+def cut_normalized(video_path, start, end, output_path, width, height, fps, has_audio, target=None):
+    """
+    Re-encodes [start, end] at width x height and fps (letterboxed); silence is added to
+    sources without audio so every part has the same streams. Without a target the part is
+    libx264/yuv420p with 48 kHz stereo AAC. With the stream info of a target source the
+    video gets its H.264 parameters (matching_encode_args) and the audio its sample rate
+    and channel count, or is left out when the target has none, so the part can be joined
+    with stream-copied parts of the target.
+    """
+    audio_rate, channels = AUDIO_RATE, 2
+    pix_fmt = "yuv420p"
+    video_args = ["-c:v", "libx264"]
+    if target is not None:
+        video_args = matching_encode_args(target)
+        pix_fmt = video_stream(target)["pix_fmt"]
+        audio = stream_signature(target)[1]
+        if audio is None:
+            has_audio = None
+        else:
+            audio_rate, channels = audio[1] or AUDIO_RATE, audio[2] or 2
+    args = ["-ss", f"{start:.3f}", "-i", video_path]
+    if has_audio is False:
+        args += ["-f", "lavfi", "-i", f"anullsrc=r={audio_rate}:cl={'mono' if channels == 1 else 'stereo'}"]
+    args += ["-t", f"{end - start:.3f}", "-map", "0:v:0",
+             "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format={pix_fmt}"] + video_args
+    if has_audio is None:
+        args += ["-an"]
+    else:
+        args += ["-map", "0:a:0" if has_audio else "1:a:0", "-c:a", "aac", "-ar", str(audio_rate),
+                 "-ac", str(channels)]
+    run_ffmpeg(args + [output_path])
+
+def compile_segments(segments, output_path, mode=MODE_SMART, on_progress=None, cancel_event=None):
+    """
+    Writes the segments, in order, into a single video at output_path.
+    Segments from sources with the stream signature of the first segment's source are cut
+    without re-encoding (smart mode re-encodes only the head GOP; copy mode starts each
+    segment at its preceding keyframe, so it keeps up to a GOP of pre-roll) and the parts
+    are stream-copy concatenated (through MPEG-TS for H.264/HEVC, see concat_copy). Only
+    the other segments are re-encoded, to the first source's parameters. In re-encode mode,
+    or when the first source cannot be matched by an encode (target_incompatibility), every
+    segment is re-encoded to its size and frame rate. Returns (written segments, re-encode
+    reason or None). Raises RuntimeError when ffmpeg/ffprobe fail.
+    """
+    on_progress = on_progress or (lambda done, total, message: None)
+    indexes = {}
+    for segment in segments:
+        if segment["video_path"] not in indexes:
+            indexes[segment["video_path"]] = load_video_index(segment["video_path"])
+    infos = {video_path: index.info for video_path, index in indexes.items()}
+    first_info = infos[segments[0]["video_path"]]
+    target = stream_signature(first_info)
+    # Sources whose segments are re-encoded: {video_path: reason}
+    encoded = {}
+    for video_path, info in infos.items():
+        if stream_signature(info) != target:
+            encoded[video_path] = "the sources differ in codec parameters"
+        elif mode == MODE_SMART and smart_cut_incompatibility(info):
+            encoded[video_path] = smart_cut_incompatibility(info)
+    reason = None
+    if mode == MODE_REENCODE:
+        reason = "re-encode mode"
+    elif encoded and target_incompatibility(first_info):
+        first_path = segments[0]["video_path"]
+        reason = encoded.get(first_path) or (f"{next(iter(encoded.values()))}, and the first source cannot be "
+                                             f"matched ({target_incompatibility(first_info)})")
+    if reason:
+        encoded = dict.fromkeys(infos, reason)
+        target_info = None
+    else:
+        target_info = first_info
+    width, height = _video_size(first_info)
+    fps = _frame_rate_text(first_info)
+
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(output_path) or None)
+    try:
+        parts = []
+        encoded_parts = 0
+        for n, segment in enumerate(segments):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RuntimeError("compilation cancelled")
+            video_path = segment["video_path"]
+            info = infos[video_path]
+            start = segment["start"]
+            end = min(segment["end"], info["duration"]) if info["duration"] else segment["end"]
+            if end <= start:
+                on_progress(n + 1, len(segments), f"Skipped \"{segment['ngram']}\": past the end of the video.")
+                continue
+            part_path = os.path.join(tmp_dir, f"{n:05d}.mp4")
+            if video_path in encoded:
+                has_audio = stream_signature(info)[1] is not None
+                cut_normalized(video_path, start, end, part_path, width, height, fps, has_audio, target_info)
+                encoded_parts += 1
+            elif mode == MODE_SMART:
+                cut_smart(video_path, start, end, part_path, indexes[video_path].keyframes, info)
+            else:
+                cut_copy(video_path, start, end, part_path, indexes[video_path].keyframes)
+            parts.append(part_path)
+            on_progress(n + 1, len(segments), f"\"{segment['ngram']}\" {start:.3f}-{end:.3f}s "
+                                              f"from {os.path.basename(video_path)}")
+        if not parts:
+            raise RuntimeError("no segment could be cut")
+        joined_path = os.path.join(tmp_dir, "joined.mp4")
+        if reason:
+            concat_copy(parts, joined_path, "h264")
+        else:
+            concat_copy(parts, joined_path, video_codec(first_info), video_timescale(first_info))
+            if encoded_parts:
+                reason = (f"{encoded_parts} of {len(parts)} part(s) matched to the first source: "
+                          f"{'; '.join(sorted(set(encoded.values())))}")
+        os.replace(joined_path, output_path)
+        return len(parts), reason
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
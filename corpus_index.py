@@ -0,0 +1,202 @@
+import heapq
+from array import array
+from operator import ne, itemgetter
+from bisect import bisect_left, bisect_right
+from itertools import compress, repeat
+from compact_ngrams import CompactNGramDict, TokenTable, gram_key, unpack_gram
+
+class CorpusIndex:
+    """
+    Merged inverted index over every loaded ngram output.
+    Compact dictionaries built on the index's token table are merged by their packed
+    token-id keys: a sorted array('Q') holds every key once per file containing it, with
+    the file ids in a parallel array('I'), so an (ngram, file) pair costs 12 bytes. They are
+    merged on the first lookup after files were added or removed, and a query candidate
+    costs one binary search regardless of how many of them are loaded. Other mappings
+    (memory-mapped .ngi indexes, plain dicts) are not copied: adding one is O(1) and every
+    lookup probes each of them, a binary search over the mapped keys or a dict probe.
+    Timestamps are read from the file's own mapping for the files that actually match.
+    """
+    def __init__(self, tokens=None):
+        self.tokens = tokens if tokens is not None else TokenTable()
+        self._next_id = 0
+        self._names = {}       # {file_id: filename}
+        self._ids = {}         # {filename: file_id}
+        self._sources = {}     # {file_id: ngram mapping}
+        self._keys = array("Q")   # merged packed keys, sorted, one entry per file containing the key
+        self._files = array("I")  # file id of each entry of _keys, in load order per key
+        self._pending = []     # ids of packed files not merged yet
+        self._stale = False    # packed files were removed since the last merge
+        self._direct = []      # ids of the other files, probed one by one, in load order
+
+    def _is_packed(self, ngram_dict):
+        return isinstance(ngram_dict, CompactNGramDict) and ngram_dict.tokens is self.tokens
+
+    def add_file(self, fname, ngram_dict):
+        """
+        Adds a file's ngram mapping to the index and returns its file id.
+        A file that is already loaded under the same name is replaced.
+        """
+        if fname in self._ids:
+            self.remove_file(fname)
+        file_id = self._next_id
+        self._next_id += 1
+        self._names[file_id] = fname
+        self._ids[fname] = file_id
+        self._sources[file_id] = ngram_dict
+        if self._is_packed(ngram_dict):
+            self._pending.append(file_id)
+        else:
+            self._direct.append(file_id)
+        return file_id
+
+    def remove_file(self, fname):
+        """
+        Removes a file from the index and returns its ngram mapping (None if it was not loaded).
+        """
+        file_id = self._ids.pop(fname, None)
+        if file_id is None:
+            return None
+        del self._names[file_id]
+        ngram_dict = self._sources.pop(file_id)
+        if not self._is_packed(ngram_dict):
+            self._direct.remove(file_id)
+        elif file_id in self._pending:
+            self._pending.remove(file_id)
+        else:
+            self._stale = True
+        return ngram_dict
+
+    def clear(self):
+        """
+        Removes every file and returns their ngram mappings.
+        """
+        sources = list(self._sources.values())
+        self._names.clear()
+        self._ids.clear()
+        self._sources.clear()
+        self._keys = array("Q")
+        self._files = array("I")
+        self._pending = []
+        self._stale = False
+        self._direct = []
+        return sources
+
+    def _merge(self):
+        """
+        Drops the packed keys of removed files and merges those of the files added since the
+        last merge.
+        """
+        if not self._pending and not self._stale:
+            return
+        keys, files = self._keys, self._files
+        if self._stale:
+            live = self._names
+            keys = array("Q", compress(keys, map(live.__contains__, files)))
+            files = array("I", compress(files, map(live.__contains__, files)))
+        runs = [zip(keys, files)] if keys else []
+        for file_id in self._pending:
+            runs.append(zip(self._sources[file_id].packed_keys(), repeat(file_id)))
+        if len(runs) == 1 and not keys:
+            file_id = self._pending[0]
+            keys = array("Q", self._sources[file_id].packed_keys())
+            files = array("I", [file_id]) * len(keys)
+        elif self._pending:
+            # Every run is sorted by (key, file id) and file ids grow in load order, so a
+            # streaming merge keeps the files of each key in load order without copying the runs.
+            keys, files = array("Q"), array("I")
+            add_key, add_file = keys.append, files.append
+            for key, file_id in heapq.merge(*runs):
+                add_key(key)
+                add_file(file_id)
+        self._keys, self._files = keys, files
+        self._pending = []
+        self._stale = False
+
+    def _packed_ids(self, gram):
+        key = gram_key(self.tokens, gram) if isinstance(gram, str) else None
+        if key is None:
+            return []
+        self._merge()
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        return list(self._files[lo:hi])
+
+    def lookup(self, gram):
+        """
+        Returns [(filename, timestamps), ...] for every loaded file containing the ngram.
+        """
+        matches = [(file_id, self._sources[file_id][gram]) for file_id in self._packed_ids(gram)]
+        packed = len(matches)
+        for file_id in self._direct:
+            times = self._sources[file_id].get(gram)
+            if times is not None:
+                matches.append((file_id, times))
+        if packed and len(matches) > packed:
+            matches.sort(key=itemgetter(0))
+        return [(self._names[file_id], times) for file_id, times in matches]
+
+    def __contains__(self, gram):
+        return bool(self._packed_ids(gram)) or any(gram in self._sources[file_id] for file_id in self._direct)
+
+    def _direct_grams(self):
+        """
+        Yields the ngrams of the other files that no packed file and no earlier file contains.
+        """
+        sources = [self._sources[file_id] for file_id in self._direct]
+        for i, ngram_dict in enumerate(sources):
+            for gram in ngram_dict:
+                if not self._packed_ids(gram) and not any(gram in earlier for earlier in sources[:i]):
+                    yield gram
+
+    def _packed_grams(self):
+        """
+        Yields the distinct ngrams of the packed files.
+        """
+        self._merge()
+        keys = self._keys
+        tokens = self.tokens
+        previous = None
+        for key in keys:
+            if key != previous:
+                previous = key
+                yield unpack_gram(tokens, key)
+
+    def __len__(self):
+        """
+        Number of distinct ngrams over all loaded files. Reads every key of the files that
+        are not merged, see ngram_count for a cheap total.
+        """
+        self._merge()
+        keys = self._keys
+        count = sum(map(ne, keys, keys[1:])) + 1 if keys else 0
+        return count + sum(1 for _gram in self._direct_grams())
+
+    def __iter__(self):
+        yield from self._packed_grams()
+        yield from self._direct_grams()
+
+    @property
+    def ngram_count(self):
+        """
+        Number of ngrams summed over the loaded files (an ngram in two files counts twice).
+        """
+        return sum(len(ngram_dict) for ngram_dict in self._sources.values())
+
+    def nbytes(self):
+        """
+        Size of the merged packed-key arrays in bytes.
+        """
+        self._merge()
+        return self._keys.itemsize * len(self._keys) + self._files.itemsize * len(self._files)
+
+    @property
+    def filenames(self):
+        return list(self._ids)
+
+    @property
+    def mappings(self):
+        """
+        The ngram mappings of the loaded files, in load order.
+        """
+        return list(self._sources.values())
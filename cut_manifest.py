@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+
+MANIFEST_FILENAME = ".cut_manifest.json"
+MANIFEST_VERSION = 1
+TEMP_PREFIX = "."
+TEMP_SUFFIX = ".part.mp4"   # clips are cut to ".<name>.part.mp4" and renamed when complete
+SAVE_INTERVAL = 2.0         # seconds between manifest writes while a job runs
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+def temp_clip_path(output_path):
+    """
+    Temporary path a clip is written to before it is renamed to output_path.
+    Keeps the .mp4 extension so ffmpeg and MoviePy pick the right muxer.
+    """
+    folder, name = os.path.split(output_path)
+    return os.path.join(folder, TEMP_PREFIX + os.path.splitext(name)[0] + TEMP_SUFFIX)
+
+def remove_partial_clips(output_dir):
+    """
+    Deletes clips left half-written by an interrupted job; returns how many were removed.
+    """
+    removed = 0
+    try:
+        names = os.listdir(output_dir)
+    except OSError:
+        return 0
+    for name in names:
+        if name.startswith(TEMP_PREFIX) and name.endswith(TEMP_SUFFIX):
+            try:
+                os.remove(os.path.join(output_dir, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+class CutManifest:
+    """
+    Persistent list of every clip planned for an output folder and its status.
+    Stored as ".cut_manifest.json" in the output folder; every entry (keyed by output file
+    name) holds the source video, the window, the cut settings, the status and, once
+    written, the file size. A clip counts as complete when its entry is done for the same
+    source, window and settings and the file still has the recorded size.
+    Safe to update from several worker threads; writes are atomic and throttled.
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("clips", {})
+        except (OSError, ValueError):
+            # A missing or damaged manifest only means nothing can be resumed.
+            self.entries = {}
+
+    @staticmethod
+    def _window(task, settings):
+        return {"video_path": os.path.abspath(task["video_path"]), "start": round(task["start"], 3),
+                "end": round(task["end"], 3), "settings": settings}
+
+    def is_complete(self, filename, task, settings):
+        with self._lock:
+            entry = self.entries.get(filename)
+        return self._entry_complete(entry, filename, task, settings)
+
+    def _entry_complete(self, entry, filename, task, settings):
+        if entry is None or entry.get("status") != STATUS_DONE:
+            return False
+        window = self._window(task, settings)
+        if any(entry.get(key) != value for key, value in window.items()):
+            return False
+        try:
+            return os.path.getsize(os.path.join(self.output_dir, filename)) == entry.get("size")
+        except OSError:
+            return False
+
+    def plan(self, spans_by_source, settings, keep_done=False):
+        """
+        Records every output file of the plan as pending. With keep_done=True entries that
+        are still complete stay done (resume); otherwise the manifest starts over.
+        """
+        with self._lock:
+            previous = dict(self.entries) if keep_done else {}
+        entries = {}
+        for spans in spans_by_source.values():
+            for span in spans:
+                for task in span["tasks"]:
+                    for filename in [task["output_filename"]] + task["aliases"]:
+                        old = previous.get(filename)
+                        if self._entry_complete(old, filename, task, settings):
+                            entries[filename] = old
+                        else:
+                            entries[filename] = dict(self._window(task, settings), status=STATUS_PENDING)
+        with self._lock:
+            self.entries = entries
+        self.save(force=True)
+
+    def mark_done(self, filename):
+        try:
+            size = os.path.getsize(os.path.join(self.output_dir, filename))
+        except OSError as e:
+            self.mark_failed(filename, e)
+            return
+        self._update(filename, status=STATUS_DONE, size=size, error=None)
+
+    def mark_failed(self, filename, error):
+        self._update(filename, status=STATUS_FAILED, error=str(error))
+
+    def _update(self, filename, **fields):
+        with self._lock:
+            entry = self.entries.setdefault(filename, {})
+            entry.update(fields)
+        self.save()
+
+    def counts(self):
+        with self._lock:
+            counts = {}
+            for entry in self.entries.values():
+                counts[entry.get("status")] = counts.get(entry.get("status"), 0) + 1
+            return counts
+
+    def save(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_save < SAVE_INTERVAL:
+                return
+            self._last_save = now
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": MANIFEST_VERSION, "clips": self.entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,173 @@
+import threading
+from array import array
+from operator import eq, itemgetter
+from collections import Counter
+
+# --- Approximate NGram Matching ---
+# Every ngram of the vocabulary is shingled into character trigrams (padded with a space on
+# both sides) and summarized by a MinHash signature. The signature is cut into bands; ngrams
+# sharing any band land in the same bucket, so a lookup only scores the few ngrams that
+# share a bucket with the query instead of the whole vocabulary (locality-sensitive hashing).
+# Signatures live in one flat array, so candidates are ranked by how many signature bins
+# they share with the query and only the best few are compared trigram by trigram.
+# Shingles are hashed with hash(), which is salted per process: the index is never saved.
+NUM_BINS = 12           # one-permutation MinHash: each shingle hash falls into one bin
+BANDS = NUM_BINS // 2   # two bins per band
+HASH_RANGE = NUM_BINS << 28  # shingle hashes are reduced below this, so bin values fit 32 bits
+BUCKET_LIMIT = 1000     # ids kept per bucket: a band shared by more ngrams says little about any
+CANDIDATE_LIMIT = 100   # candidates sharing the most bands are ranked by signature agreement
+SCORE_LIMIT = 10        # best-ranked candidates scored by exact trigram Jaccard similarity
+MIN_SCORE = 0.3         # minimum trigram Jaccard similarity of a suggestion
+BATCH_SIZE = 10000      # ngrams added per lock hold while a vocabulary is indexed
+
+def char_trigrams(text):
+    """
+    Returns the set of character trigrams of " text ".
+    """
+    padded = f" {text} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+def minhash_signatures(texts):
+    """
+    One-permutation MinHash signatures of several texts, as one flat array('I') of NUM_BINS
+    values per text. Every trigram of " text " is hashed once into h < HASH_RANGE and falls
+    into bin h % NUM_BINS, which keeps its minimum h. An empty bin holds HASH_RANGE + its
+    bin number, so every value of a bin is congruent to the bin number modulo NUM_BINS.
+    """
+    signatures = array("I")
+    extend = signatures.extend
+    empty = [HASH_RANGE + bin_no for bin_no in range(NUM_BINS)]
+    for text in texts:
+        padded = f" {text} "
+        signature = empty[:]
+        for h in [hash(padded[i:i+3]) % HASH_RANGE for i in range(len(padded) - 2)]:
+            bin_no = h % NUM_BINS
+            if h < signature[bin_no]:
+                signature[bin_no] = h
+        extend(signature)
+    return signatures
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+def band_keys(signatures):
+    """
+    Band keys of a flat signature array: every two bins form a band, packed into one 64-bit
+    int. Keys of different bands never collide, as bin values encode their bin number.
+    """
+    return [high << 32 | low for high, low in zip(signatures[0::2], signatures[1::2])]
+
+class FuzzyIndex:
+    """
+    MinHash LSH index over an ngram vocabulary. suggest() returns the existing ngrams
+    closest to a string that was not found, ranked by character-trigram Jaccard similarity.
+    Candidates are the ngrams sharing the most bands with the query, narrowed down by the
+    number of signature bins they agree on, so recall does not depend on load order.
+    Buckets keep at most BUCKET_LIMIT ids. Ngrams that are already indexed are skipped.
+    Safe to extend from a background thread while other threads query it: update() only
+    holds the lock for one batch of ngrams at a time.
+    """
+    def __init__(self, grams=()):
+        self._grams = []              # gram id -> ngram
+        self._known = set()           # indexed ngrams
+        self._signatures = array("I") # NUM_BINS values per gram id
+        self._buckets = {}            # {band key: gram id, or array of gram ids}
+        self._lock = threading.Lock()
+        self.update(grams)
+
+    def add(self, gram):
+        self._add_batch([gram])
+
+    def update(self, grams):
+        """
+        Indexes an iterable of ngrams; returns the number of ngrams that were new.
+        """
+        added = 0
+        batch = []
+        for gram in grams:
+            batch.append(gram)
+            if len(batch) >= BATCH_SIZE:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        return added
+
+    def _add_batch(self, grams):
+        known = self._known
+        grams = [gram for gram in dict.fromkeys(grams) if gram not in known]
+        if not grams:
+            return 0
+        # Signatures are computed before taking the lock, so queries only wait for the inserts.
+        signatures = minhash_signatures(grams)
+        keys = band_keys(signatures)
+        with self._lock:
+            # Another thread may have indexed some of the ngrams meanwhile.
+            fresh = [i for i, gram in enumerate(grams) if gram not in known]
+            if len(fresh) < len(grams):
+                signatures = array("I", [v for i in fresh for v in signatures[i * NUM_BINS:(i + 1) * NUM_BINS]])
+                keys = [key for i in fresh for key in keys[i * BANDS:(i + 1) * BANDS]]
+                grams = [grams[i] for i in fresh]
+            first_id = len(self._grams)
+            self._grams.extend(grams)
+            known.update(grams)
+            self._signatures.extend(signatures)
+            buckets = self._buckets
+            owners = [gram_id for gram_id in range(first_id, first_id + len(grams)) for _band in range(BANDS)]
+            for key, gram_id in zip(keys, owners):
+                ids = buckets.get(key)
+                if ids is None:
+                    # Most bands are unique to one ngram, so a bare id is stored until a second one arrives.
+                    buckets[key] = gram_id
+                elif isinstance(ids, int):
+                    buckets[key] = array("I", (ids, gram_id))
+                elif len(ids) < BUCKET_LIMIT:
+                    ids.append(gram_id)
+        return len(grams)
+
+    def __len__(self):
+        return len(self._grams)
+
+    def candidates(self, text, limit=SCORE_LIMIT):
+        """
+        Ids of up to limit ngrams with the highest estimated similarity to text: of those
+        sharing the most bands with it, the ones agreeing on the most signature bins.
+        """
+        signature = minhash_signatures([text])
+        with self._lock:
+            counts = Counter()
+            for key in band_keys(signature):
+                ids = self._buckets.get(key)
+                if ids is None:
+                    continue
+                if isinstance(ids, int):
+                    counts[ids] += 1
+                else:
+                    counts.update(ids)
+            if not counts:
+                return []
+            signatures = self._signatures
+            ranked = []
+            for gram_id, _bands in counts.most_common(CANDIDATE_LIMIT):
+                start = gram_id * NUM_BINS
+                ranked.append((sum(map(eq, signature, signatures[start:start + NUM_BINS])), gram_id))
+        ranked.sort(key=itemgetter(0), reverse=True)
+        return [gram_id for _bins, gram_id in ranked[:limit]]
+
+    def suggest(self, text, k=3, min_score=MIN_SCORE, accept=None):
+        """
+        Returns up to k [(ngram, score), ...] pairs, best first. accept(ngram) can reject
+        entries, e.g. ngrams of files that were unloaded after they were indexed.
+        """
+        shingles = char_trigrams(text)
+        scores = {}
+        for gram_id in self.candidates(text, max(SCORE_LIMIT, 2 * k)):
+            gram = self._grams[gram_id]
+            if gram == text or (accept is not None and not accept(gram)):
+                continue
+            scores[gram] = jaccard(shingles, char_trigrams(gram))
+        scored = sorted((-score, gram) for gram, score in scores.items() if score >= min_score)
+        return [(gram, round(-score, 3)) for score, gram in scored[:k]]
@@ -1,37 +1,24 @@
 import os
-import re
 import json
+import time
 import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from moviepy.video.io.VideoFileClip import VideoFileClip  # Current MoviePy import
-
-# --- Helper Functions ---
-def srt_time_to_seconds(srt_time):
-    """
-    Converts the time in SRT format to seconds.
-    Example: "00:03:08,480" -> 188.48
-    """
-    h, m, s_ms = srt_time.split(':')
-    s, ms = s_ms.split(',')
-    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000
-
-def parse_srt(content):
-    """
-    Takes SRT content and returns a list containing each subtitle block 
-    (start time, text).
-    """
-    blocks = content.strip().split('\n\n')
-    subtitles = []
-    for block in blocks:
-        lines = block.splitlines()
-        if len(lines) >= 3:
-            time_line = lines[1]
-            text = " ".join(lines[2:])
-            start_time_str = time_line.split(" --> ")[0]
-            start_time = srt_time_to_seconds(start_time_str)
-            subtitles.append((start_time, text))
-    return subtitles
+from ngram_core import (process_srt_files, save_detailed_output, save_plain_output, build_options,
+                        duplicate_base_names)
+from build_cache import BuildCache
+from phrase_index import PhraseIndex
+from ngram_query import QueryEngine, tokenize_query
+from video_cutter import (CUT_MODES, MODE_COPY, MODE_SMART, MODE_REENCODE, CutScheduler, plan_cut_tasks,
+                          validate_cut_tasks, plan_spans)
+from video_index import load_video_index
+from clip_cache import ClipCache
+from cut_manifest import CutManifest
+from compilation import plan_compilation, compile_segments
+from metrics import METRICS, profile, profile_path, export_metrics
+from ui_events import EventPump
+
+SUGGESTION_COUNT = 3  # close matches shown for every NOT FOUND segment
 
 # --- Tab 1: NGram (Bigram & Trigram) Creator (Multiple File Selection and Automatic Output Folder) ---
 class GramCreatorTab(tk.Frame):
@@ -40,6 +27,8 @@ class GramCreatorTab(tk.Frame):
         self.main_app = main_app
         self.srt_file_paths = []  # List for multiple file selection
         self.ngram_outputs = {}   # {filename: ngram_dict}
+        self.source_digests = {}  # {filename: (source path, content hash)} for the build cache
+        self.processed_lowercase = True
         # Create output folder (in the directory where the code is located, named "ngram_outputs")
         self.output_folder = os.path.join(os.getcwd(), "ngram_outputs")
         os.makedirs(self.output_folder, exist_ok=True)
@@ -59,13 +48,17 @@ class GramCreatorTab(tk.Frame):
         output_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.output_format = tk.StringVar()
         self.output_combobox = ttk.Combobox(options_frame, textvariable=self.output_format, state="readonly",
-                                              values=["JSON", "TXT"])
+                                              values=["JSON", "TXT", "NGI", "NGS"])
         self.output_combobox.current(0)
         self.output_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="w")
         self.case_insensitive_var = tk.BooleanVar(value=True)
         case_check = ttk.Checkbutton(options_frame, text="Convert to lowercase (Case Insensitive)",
                                      variable=self.case_insensitive_var)
         case_check.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        self.skip_unchanged_var = tk.BooleanVar(value=True)
+        skip_check = ttk.Checkbutton(options_frame, text="Skip unchanged files (build cache)",
+                                     variable=self.skip_unchanged_var)
+        skip_check.grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="w")
 
         progress_frame = ttk.LabelFrame(self, text="Progress / Log")
         progress_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -73,6 +66,7 @@ class GramCreatorTab(tk.Frame):
         self.progress_bar.pack(fill="x", padx=10, pady=5)
         self.log_text = tk.Text(progress_frame, wrap="word", height=15)
         self.log_text.pack(fill="both", padx=10, pady=5, expand=True)
+        self.events = EventPump(self, self.log_text, self.progress_bar)
 
         button_frame = ttk.Frame(self)
         button_frame.pack(pady=5)
@@ -82,6 +76,8 @@ class GramCreatorTab(tk.Frame):
         save_detailed_button.grid(row=0, column=1, padx=5)
         save_plain_button = ttk.Button(button_frame, text="Save Plain Text Output", command=self.save_plain_text_output)
         save_plain_button.grid(row=0, column=2, padx=5)
+        cancel_button = ttk.Button(button_frame, text="Cancel", command=self.events.cancel_job)
+        cancel_button.grid(row=0, column=3, padx=5)
 
     def select_files(self):
         file_paths = filedialog.askopenfilenames(title="Select SRT Files",
@@ -93,94 +89,134 @@ class GramCreatorTab(tk.Frame):
             self.log("Selected files: " + ", ".join(self.srt_file_paths))
 
     def log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
+        # Safe from any thread; the event pump writes it on the Tk thread.
+        self.events.log(message)
 
     def start_processing(self):
         if not self.srt_file_paths:
             messagebox.showwarning("Warning", "Please select at least one SRT file.")
             return
+        duplicates = duplicate_base_names(self.srt_file_paths)
+        if duplicates:
+            # Outputs and results are keyed by base name, so one file would replace the other.
+            messagebox.showwarning("Warning", "These files share a name, select only one of each:\n"
+                                   + "\n".join(", ".join(paths) for paths in duplicates.values()))
+            return
+        job = self.events.begin_job("processing")
+        if job is None:
+            messagebox.showwarning("Warning", "Processing is already running.")
+            return
         self.log("Processing started...")
-        self.progress_bar['value'] = 0
-        threading.Thread(target=self.process_files, daemon=True).start()
+        self.events.progress(0)
+        # Tk variables must not be read from the worker thread, so the options are captured here.
+        options = build_options(self.case_insensitive_var.get(), self.output_format.get())
+        threading.Thread(target=self.main_app.run_stage,
+                         args=("process_files", self.main_app.profile_file("process_files"), job,
+                               self.process_files, list(self.srt_file_paths), options,
+                               self.skip_unchanged_var.get()),
+                         daemon=True).start()
 
-    def process_files(self):
+    def process_files(self, job, file_paths, options, skip_unchanged):
         self.ngram_outputs = {}
-        total_files = len(self.srt_file_paths)
-        for idx, file_path in enumerate(self.srt_file_paths):
-            self.log(f"Processing: {file_path}")
+        self.source_digests = {}
+        self.processed_lowercase = options["lowercase"]
+        total_files = len(file_paths)
+        cache = BuildCache(self.output_folder)
+        pending = []
+        for file_path in file_paths:
+            if job.cancelled:
+                self.log("Processing cancelled.")
+                return
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                subtitles = parse_srt(content)
-                ngram_dict = {}
-                for start_time, text in subtitles:
-                    if self.case_insensitive_var.get():
-                        text = text.lower()
-                    words = re.findall(r'\b\w+\b', text, flags=re.UNICODE)
-                    # Bigrams:
-                    for i in range(len(words) - 1):
-                        gram = words[i] + " " + words[i+1]
-                        ngram_dict.setdefault(gram, []).append(start_time)
-                    # Trigrams:
-                    for i in range(len(words) - 2):
-                        gram = words[i] + " " + words[i+1] + " " + words[i+2]
-                        ngram_dict.setdefault(gram, []).append(start_time)
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                self.ngram_outputs[base_name] = ngram_dict
-                self.log(f"{base_name} file processed. {len(ngram_dict)} ngrams found.")
-            except Exception as e:
+                if skip_unchanged and cache.is_unchanged(file_path, options, ["detailed"]):
+                    fresh, digest = True, None
+                else:
+                    fresh, digest = cache.is_fresh(file_path, options, ["detailed"])
+            except OSError as e:
                 self.log(f"Error {file_path}: {e}")
-            self.progress_bar['value'] = (idx + 1) / total_files * 100
+                continue
+            if skip_unchanged and fresh:
+                self.log(f"{base_name} unchanged, skipped (outputs are up to date).")
+                continue
+            self.source_digests[base_name] = (file_path, digest)
+            pending.append(file_path)
+        done = total_files - len(pending)
+        self.events.progress(done / total_files * 100)
+        phrases = options["format"] == "NGS"
+        for result in process_srt_files(pending, lowercase=options["lowercase"], compact=True, phrases=phrases):
+            if job.cancelled:
+                # Leaving the loop closes the generator, which cancels the chunks not started yet.
+                self.log(f"Processing cancelled after {done} of {total_files} file(s).")
+                return
+            if result["error"]:
+                self.log(f"Error {result['path']}: {result['error']}")
+            else:
+                base_name = result["base_name"]
+                self.ngram_outputs[base_name] = result["ngrams"]
+                METRICS.count("srt_files")
+                METRICS.count("ngrams", result["ngram_count"])
+                found = "tokens indexed" if phrases else "ngrams found"
+                self.log(f"{base_name} file processed. {result['ngram_count']} {found}.")
+            done += 1
+            self.events.progress(done / total_files * 100)
         self.log("All files processed.")
 
+    def record_outputs(self, kind, saved_paths, output_format):
+        """
+        Records saved outputs {base_name: path} in the build cache of the output folder.
+        """
+        cache = BuildCache(self.output_folder)
+        options = build_options(self.processed_lowercase, output_format)
+        for base_name, output_path in saved_paths.items():
+            if base_name in self.source_digests:
+                source_path, digest = self.source_digests[base_name]
+                cache.record(source_path, digest, options, {kind: output_path})
+        try:
+            cache.save()
+        except OSError as e:
+            self.log(f"Error saving build cache: {e}")
+
     def save_detailed_output(self):
         if not self.ngram_outputs:
             messagebox.showwarning("Warning", "Please process the files first.")
             return
         output_format = self.output_format.get()
+        saved_paths = {}
         for base_name, ngram_dict in self.ngram_outputs.items():
-            if output_format == "JSON":
-                output_str = json.dumps(ngram_dict, ensure_ascii=False, indent=4)
-                ext = ".json"
-            else:
-                lines = []
-                for gram, times in ngram_dict.items():
-                    lines.append(f"{gram}: {times}")
-                output_str = "\n".join(lines)
-                ext = ".txt"
-            output_path = os.path.join(self.output_folder, base_name + "_detailed" + ext)
             try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(output_str)
+                output_path = save_detailed_output(ngram_dict, self.output_folder, base_name, output_format)
+                saved_paths[base_name] = output_path
                 self.log(f"Detailed output saved: {output_path}")
             except Exception as e:
                 self.log(f"Error saving output for {base_name}: {e}")
+        self.record_outputs("detailed", saved_paths, output_format)
 
     def save_plain_text_output(self):
         if not self.ngram_outputs:
             messagebox.showwarning("Warning", "Please process the files first.")
             return
-        # In the plain text output, only the ngram words (bigram and trigram) will be included.
-        # Each will be enclosed in quotes and combined into a single, comma-separated line.
+        saved_paths = {}
         for base_name, ngram_dict in self.ngram_outputs.items():
-            ngram_list = list(ngram_dict.keys())
-            # Enclose each ngram in quotes and create a comma-separated string.
-            output_str = ", ".join([f"\"{ng}\"" for ng in ngram_list])
-            output_path = os.path.join(self.output_folder, base_name + "_plain.txt")
+            if isinstance(ngram_dict, PhraseIndex):
+                self.log(f"No plain text output for the phrase index of {base_name}.")
+                continue
             try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(output_str)
+                output_path = save_plain_output(ngram_dict, self.output_folder, base_name)
+                saved_paths[base_name] = output_path
                 self.log(f"Plain text output saved: {output_path}")
             except Exception as e:
                 self.log(f"Error saving plain text output for {base_name}: {e}")
+        self.record_outputs("plain", saved_paths, self.output_format.get())
 
 # --- Tab 2: NGram Query and Query Output Generation ---
 class GramQueryTab(tk.Frame):
     def __init__(self, master, main_app):
         super().__init__(master)
         self.main_app = main_app
-        self.loaded_outputs = []  # List of tuples: (filename, dictionary)
+        # Merged ngram index and phrase indexes of all loaded output files; the suggestion index
+        # is filled on worker threads so loading and searching never wait for it.
+        self.engine = QueryEngine(background_suggestions=True)
         self.query_results = []   # Query results; each entry is a dict with keys: ngram, type, indices, matches, found
         self.create_widgets()
 
@@ -194,12 +230,24 @@ class GramQueryTab(tk.Frame):
         self.case_insensitive = tk.BooleanVar(value=True)
         case_check = ttk.Checkbutton(options_frame, text="Convert to lowercase (Case Insensitive)", variable=self.case_insensitive)
         case_check.pack(side="left", padx=5)
+        self.optimal_segmentation = tk.BooleanVar(value=False)
+        optimal_check = ttk.Checkbutton(options_frame, text="Optimal segmentation (fewest NOT FOUND words)",
+                                        variable=self.optimal_segmentation)
+        optimal_check.pack(side="left", padx=5)
+        self.suggest_matches = tk.BooleanVar(value=False)
+        suggest_check = ttk.Checkbutton(options_frame, text="Suggest close matches for NOT FOUND",
+                                        variable=self.suggest_matches, command=self.index_suggestions)
+        suggest_check.pack(side="left", padx=5)
         load_frame = ttk.Frame(self)
         load_frame.pack(fill="x", padx=10, pady=5)
         load_button = ttk.Button(load_frame, text="Load Output Files", command=self.load_output_files)
         load_button.pack(side="left", padx=5)
+        remove_button = ttk.Button(load_frame, text="Remove Selected", command=self.remove_output_files)
+        remove_button.pack(side="left", padx=5)
         self.loaded_label = ttk.Label(load_frame, text="No file loaded yet.")
         self.loaded_label.pack(side="left", padx=5)
+        self.loaded_listbox = tk.Listbox(self, height=4, selectmode="extended")
+        self.loaded_listbox.pack(fill="x", padx=10, pady=5)
         search_button = ttk.Button(self, text="Search", command=self.search_ngrams)
         search_button.pack(pady=5)
         output_button = ttk.Button(self, text="Get Query Output", command=self.save_query_output)
@@ -211,44 +259,55 @@ class GramQueryTab(tk.Frame):
         self.results_text.tag_configure("missing", foreground="red")
 
     def load_output_files(self):
+        """
+        Adds the selected output files to the merged corpus index.
+        Files that are already loaded under the same name are replaced.
+        """
         file_paths = filedialog.askopenfilenames(title="Select Output Files",
-                                                 filetypes=[("JSON Files", "*.json"), ("Text Files", "*.txt")])
+                                                 filetypes=[("JSON Files", "*.json"), ("Text Files", "*.txt"),
+                                                            ("NGram Index Files", "*.ngi"),
+                                                            ("Phrase Index Files", "*.ngs")])
         if not file_paths:
             return
-        self.loaded_outputs.clear()
-        file_names = []
         for path in file_paths:
             try:
-                if path.lower().endswith(".json"):
-                    with open(path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    self.loaded_outputs.append((os.path.basename(path), data))
-                    file_names.append(os.path.basename(path))
-                else:
-                    data = {}
-                    with open(path, 'r', encoding='utf-8') as f:
-                        for line in f:
-                            if ": " in line:
-                                parts = line.strip().split(": ", 1)
-                                key = parts[0]
-                                try:
-                                    value = eval(parts[1])
-                                except Exception:
-                                    value = []
-                                data[key] = value
-                    self.loaded_outputs.append((os.path.basename(path), data))
-                    file_names.append(os.path.basename(path))
+                self.engine.load_file(path, compact=True)
             except Exception as e:
                 messagebox.showerror("Error", f"An error occurred while loading {os.path.basename(path)}: {e}")
-        self.loaded_label.config(text="Loaded files: " + ", ".join(file_names))
+        self.refresh_loaded_files()
+        self.index_suggestions()
+
+    def index_suggestions(self):
+        """
+        Adds the vocabulary loaded so far to the suggestion index on a worker thread, when
+        suggestions are switched on.
+        """
+        if self.suggest_matches.get():
+            self.engine.enable_suggestions()
+            threading.Thread(target=self.engine.index_suggestions, daemon=True).start()
+
+    def remove_output_files(self):
+        selected = [self.loaded_listbox.get(i) for i in self.loaded_listbox.curselection()]
+        for fname in selected:
+            self.engine.remove_file(fname)
+        self.refresh_loaded_files()
+
+    def refresh_loaded_files(self):
+        file_names = self.engine.filenames
+        self.loaded_listbox.delete(0, tk.END)
+        for fname in file_names:
+            self.loaded_listbox.insert(tk.END, fname)
+        if file_names:
+            self.loaded_label.config(text=f"Loaded files: {len(file_names)} ({self.engine.corpus_index.ngram_count} "
+                                          f"ngrams, {len(self.engine.phrase_corpus.filenames)} phrase indexes)")
+        else:
+            self.loaded_label.config(text="No file loaded yet.")
 
     def search_ngrams(self):
         """
-        Using a greedy approach, splits the query sentence from left to right into segments:
-        - First, checks for trigrams.
-        - If not found, checks for bigrams.
-        - Whichever is found, that segment is taken and indices are skipped.
-        Thus, overlapping and repetitions are prevented.
+        Splits the query sentence into found segments and NOT FOUND segments, either greedily
+        (longest phrase, then trigram, then bigram; see QueryEngine.segment_greedy) or with the
+        optimal segmentation that minimizes NOT FOUND words.
         """
         self.results_text.delete("1.0", tk.END)
         query = self.query_text.get("1.0", tk.END).strip()
@@ -257,76 +316,18 @@ class GramQueryTab(tk.Frame):
             return
         if self.case_insensitive.get():
             query = query.lower()
-        words = re.findall(r'\b\w+\b', query, flags=re.UNICODE)
-        self.query_results = []
-        i = 0
-        while i < len(words):
-            # First check for trigram
-            if i <= len(words) - 3:
-                trigram = " ".join(words[i:i+3])
-                matches = []
-                for fname, out_dict in self.loaded_outputs:
-                    if trigram in out_dict:
-                        matches.append((fname, out_dict[trigram]))
-                if matches:
-                    self.query_results.append({
-                        "ngram": trigram,
-                        "type": "trigram",
-                        "indices": list(range(i, i+3)),
-                        "matches": matches,
-                        "found": True
-                    })
-                    i += 3
-                    continue  # Proceed to the next segment
-            # If trigram not found, check for bigram
-            if i <= len(words) - 2:
-                bigram = " ".join(words[i:i+2])
-                matches = []
-                for fname, out_dict in self.loaded_outputs:
-                    if bigram in out_dict:
-                        matches.append((fname, out_dict[bigram]))
-                if matches:
-                    self.query_results.append({
-                        "ngram": bigram,
-                        "type": "bigram",
-                        "indices": [i, i+1],
-                        "matches": matches,
-                        "found": True
-                    })
-                    i += 2
-                    continue
-            # If neither trigram nor bigram is found: record the segment as "NOT FOUND".
-            if i <= len(words) - 3:
-                trigram = " ".join(words[i:i+3])
-                self.query_results.append({
-                    "ngram": trigram,
-                    "type": "trigram",
-                    "indices": list(range(i, i+3)),
-                    "matches": [],
-                    "found": False
-                })
-                i += 3
-            elif i <= len(words) - 2:
-                bigram = " ".join(words[i:i+2])
-                self.query_results.append({
-                    "ngram": bigram,
-                    "type": "bigram",
-                    "indices": [i, i+1],
-                    "matches": [],
-                    "found": False
-                })
-                i += 2
-            else:
-                self.query_results.append({
-                    "ngram": words[i],
-                    "type": "unigram",
-                    "indices": [i],
-                    "matches": [],
-                    "found": False
-                })
-                i += 1
+        words = tokenize_query(query, lowercase=False)
+        with profile(self.main_app.profile_file("search_ngrams")):
+            self.query_results = self.engine.segment(words, self.optimal_segmentation.get())
+            if self.suggest_matches.get():
+                with METRICS.timer("suggest"):
+                    self.engine.add_suggestions(self.query_results, SUGGESTION_COUNT)
+        export_metrics()
 
         # Display results on screen
+        if self.suggest_matches.get() and not self.engine.suggestions_ready:
+            self.results_text.insert(tk.END, "(Suggestions are still being indexed; they cover part of the "
+                                             "loaded files.)\n")
         for res in self.query_results:
             line = f"{res['ngram']} ({res['type']}): "
             if res["found"]:
@@ -336,6 +337,8 @@ class GramQueryTab(tk.Frame):
                 line += "; ".join(details)
             else:
                 line += "NOT FOUND"
+                if res.get("suggestions"):
+                    line += " (did you mean: " + ", ".join(s["ngram"] for s in res["suggestions"]) + ")"
             line += "\n"
             if not res["found"]:
                 self.results_text.insert(tk.END, line, "missing")
@@ -361,6 +364,7 @@ class VideoCutterTab(tk.Frame):
         super().__init__(master)
         self.main_app = main_app
         self.video_files = {}  # {base filename (without extension): full path}
+        self.video_indexes = {}  # {full path: VideoIndex}, filled in the background by load_videos
         self.output_dir = None
         self.create_widgets()
 
@@ -379,6 +383,37 @@ class VideoCutterTab(tk.Frame):
         self.output_dir_label = ttk.Label(output_frame, text="No folder selected yet.")
         self.output_dir_label.pack(side="left", padx=5, pady=5)
 
+        options_frame = ttk.LabelFrame(self, text="Options")
+        options_frame.pack(fill="x", padx=10, pady=5)
+        mode_label = ttk.Label(options_frame, text="Cutting Mode:")
+        mode_label.grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        self.cut_mode = tk.StringVar()
+        self.mode_combobox = ttk.Combobox(options_frame, textvariable=self.cut_mode, state="readonly",
+                                          values=list(CUT_MODES), width=32)
+        self.mode_combobox.current(0)
+        self.mode_combobox.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        workers_label = ttk.Label(options_frame, text="Concurrent Encodes:")
+        workers_label.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.max_workers = tk.IntVar(value=min(4, os.cpu_count() or 1))
+        workers_spinbox = ttk.Spinbox(options_frame, from_=1, to=32, textvariable=self.max_workers, width=5)
+        workers_spinbox.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+        self.use_clip_cache = tk.BooleanVar(value=True)
+        cache_check = ttk.Checkbutton(options_frame, text="Reuse previously cut clips (clip cache), size limit (GB):",
+                                      variable=self.use_clip_cache)
+        cache_check.grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        self.clip_cache_gb = tk.DoubleVar(value=10)
+        cache_spinbox = ttk.Spinbox(options_frame, from_=1, to=1000, textvariable=self.clip_cache_gb, width=5)
+        cache_spinbox.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        self.resume_job = tk.BooleanVar(value=True)
+        resume_check = ttk.Checkbutton(options_frame, text="Resume an interrupted job (skip clips already cut)",
+                                       variable=self.resume_job)
+        resume_check.grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        self.compilation = tk.BooleanVar(value=False)
+        compilation_check = ttk.Checkbutton(options_frame,
+                                            text="Compilation: one video of the query in order (subtitle end times)",
+                                            variable=self.compilation, command=self.on_compilation_toggle)
+        compilation_check.grid(row=4, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+
         process_button = ttk.Button(self, text="Cut Videos", command=self.start_cutting)
         process_button.pack(pady=10)
         progress_frame = ttk.LabelFrame(self, text="Progress")
@@ -387,8 +422,15 @@ class VideoCutterTab(tk.Frame):
         self.progress_bar.pack(fill="x", padx=10, pady=5)
         self.log_text = tk.Text(progress_frame, wrap="word", height=15)
         self.log_text.pack(fill="both", padx=10, pady=5, expand=True)
+        self.events = EventPump(self, self.log_text, self.progress_bar)
+        cancel_button = ttk.Button(self, text="Cancel", command=self.events.cancel_job)
+        cancel_button.pack(pady=5)
 
     def load_videos(self):
+        if self.events.job_running:
+            # The running job reads the loaded videos and their indexes.
+            messagebox.showwarning("Warning", f"Please wait, {self.events.job.name} is still running.")
+            return
         file_paths = filedialog.askopenfilenames(title="Select Video Files",
                                                   filetypes=[("MP4 Files", "*.mp4")])
         if not file_paths:
@@ -400,6 +442,32 @@ class VideoCutterTab(tk.Frame):
             self.video_files[base] = path
             file_names.append(os.path.basename(path))
         self.video_list_label.config(text="Loaded videos: " + ", ".join(file_names))
+        self.video_indexes = {}
+        job = self.events.begin_job("indexing")
+        self.events.progress(0)
+        threading.Thread(target=self.main_app.run_stage,
+                         args=("index_videos", self.main_app.profile_file("index_videos"), job,
+                               self.index_videos, list(file_paths)),
+                         daemon=True).start()
+
+    def index_videos(self, job, paths):
+        """
+        Loads or builds the sidecar index of every video (duration, streams, keyframes), so
+        cut windows can be checked before cutting and sources open without probing.
+        """
+        for n, path in enumerate(paths):
+            if job.cancelled:
+                self.log("Video indexing cancelled.")
+                return
+            try:
+                index = load_video_index(path)
+            except (OSError, RuntimeError) as e:
+                self.log(f"Could not index {os.path.basename(path)}: {e}")
+            else:
+                self.video_indexes[path] = index
+                self.log(f"Indexed {os.path.basename(path)}: {index.duration:.1f}s, "
+                         f"{len(index.keyframes)} keyframe(s).")
+            self.events.progress((n + 1) / len(paths) * 100)
 
     def select_output_dir(self):
         dir_path = filedialog.askdirectory(title="Select Output Folder")
@@ -408,8 +476,8 @@ class VideoCutterTab(tk.Frame):
             self.output_dir_label.config(text=dir_path)
 
     def log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
+        # Safe from any thread; the event pump writes it on the Tk thread.
+        self.events.log(message)
 
     def start_cutting(self):
         if not self.main_app.query_output:
@@ -421,50 +489,113 @@ class VideoCutterTab(tk.Frame):
         if not self.output_dir:
             messagebox.showwarning("Warning", "Please select an output folder.")
             return
-        threading.Thread(target=self.process_cutting, daemon=True).start()
+        mode = CUT_MODES[self.cut_mode.get()]
+        try:
+            max_workers = max(1, int(self.max_workers.get()))
+        except (tk.TclError, ValueError):
+            max_workers = 1
+        cache_bytes = None
+        if self.use_clip_cache.get():
+            try:
+                cache_bytes = int(float(self.clip_cache_gb.get()) * 1024 ** 3)
+            except (tk.TclError, ValueError):
+                cache_bytes = None
+        job = self.events.begin_job("cutting")
+        if job is None:
+            messagebox.showwarning("Warning", f"Please wait, {self.events.job.name} is still running.")
+            return
+        self.events.progress(0)
+        if self.compilation.get():
+            threading.Thread(target=self.main_app.run_stage,
+                             args=("process_compilation", self.main_app.profile_file("process_compilation"), job,
+                                   self.process_compilation, mode),
+                             daemon=True).start()
+            return
+        threading.Thread(target=self.main_app.run_stage,
+                         args=("process_cutting", self.main_app.profile_file("process_cutting"), job,
+                               self.process_cutting, mode, max_workers, cache_bytes, self.resume_job.get()),
+                         daemon=True).start()
 
-    def process_cutting(self):
-        query_output = self.main_app.query_output
-        total_tasks = sum(len(entry["matches"]) for entry in query_output if entry["found"])
-        if total_tasks == 0:
+    def process_cutting(self, job, mode, max_workers, cache_bytes=None, resume=False):
+        """
+        Groups every requested clip by source video, drops exact duplicates, merges
+        overlapping windows into spans that are decoded once and cuts them on a bounded
+        worker pool; each worker opens its source once.
+        The job is recorded in a manifest in the output folder; with resume=True clips that
+        an interrupted run already completed are verified and skipped.
+        """
+        groups, missing = plan_cut_tasks(self.main_app.query_output, self.video_files)
+        for base in missing:
+            self.log(f"Video not found: {base}")
+        groups, dropped = validate_cut_tasks(groups, self.video_indexes)
+        for base, start_time in dropped:
+            self.log(f"Skipped {base} at {start_time:.3f}s: past the end of the video.")
+        if not groups:
             self.log("No match found, no video segment to cut.")
             return
-        task_count = 0
-        for idx, entry in enumerate(query_output):
-            if not entry["found"]:
-                continue
-            for match in entry["matches"]:
-                fname, times = match
-                base = os.path.splitext(fname)[0]
-                if base not in self.video_files:
-                    self.log(f"Video not found: {base}")
-                    continue
-                video_path = self.video_files[base]
-                try:
-                    clip = VideoFileClip(video_path)
-                except Exception as e:
-                    self.log(f"Error loading video: {video_path} - {e}")
-                    continue
-                for t in times:
-                    start_time = t
-                    end_time = start_time + 5
-                    if end_time > clip.duration:
-                        end_time = clip.duration
-                    try:
-                        subclip = clip.subclip(start_time, end_time)
-                        output_filename = f"{base}_{entry['type']}_{idx}_{int(start_time)}.mp4"
-                        output_filepath = os.path.join(self.output_dir, output_filename)
-                        self.log(f"Cutting {output_filename}...")
-                        subclip.write_videofile(output_filepath, codec="libx264", audio_codec="aac",
-                                                  verbose=False, logger=None)
-                        self.log(f"{output_filename} saved.")
-                    except Exception as e:
-                        self.log(f"Error: {video_path} {start_time} - {e}")
-                    task_count += 1
-                    progress = task_count / total_tasks * 100
-                    self.progress_bar['value'] = progress
-                clip.close()
-        self.log("Video cutting process completed.")
+        spans, stats = plan_spans(groups)
+        if mode == MODE_REENCODE:
+            self.log(f"Cut plan: {stats['clips']} clip(s) in {stats['spans']} span(s), "
+                     f"{stats['span_seconds']:.1f}s decoded instead of {stats['clip_seconds']:.1f}s "
+                     f"({stats['saved_seconds']:.1f}s saved).")
+        else:
+            # Copy and smart cuts read each clip's own packets, so merged spans save nothing.
+            self.log(f"Cut plan: {stats['clips']} clip(s) from {len(groups)} video(s).")
+        clip_cache = None
+        if cache_bytes:
+            try:
+                clip_cache = ClipCache(max_bytes=cache_bytes)
+            except OSError as e:
+                self.log(f"Clip cache unavailable: {e}")
+        scheduler = CutScheduler(self.output_dir, mode, max_workers, on_progress=self.on_cut_progress,
+                                 clip_cache=clip_cache, cancel_event=job.cancel_event,
+                                 manifest=CutManifest(self.output_dir), resume=resume)
+        failed = scheduler.run(spans)
+        if scheduler.cancelled:
+            self.log(f"Video cutting cancelled. {scheduler.cancelled} clip(s) not cut.")
+        self.log(f"Video cutting process completed. {scheduler.resumed} clip(s) kept from the previous run, "
+                 f"{scheduler.cache_hits} clip(s) reused from the cache, {failed} clip(s) failed.")
+        encode_fps = METRICS.rates().get("encode_fps")
+        if encode_fps:
+            self.log(f"Encode speed: {encode_fps:.1f} frames/s per worker.")
+
+    def on_compilation_toggle(self):
+        """
+        Compilations default to smart cut: only the segments whose source differs from the
+        first one are re-encoded. Re-encode mode can still be picked afterwards.
+        """
+        if self.compilation.get() and CUT_MODES.get(self.cut_mode.get()) != MODE_SMART:
+            self.cut_mode.set(next(label for label, mode in CUT_MODES.items() if mode == MODE_SMART))
+
+    def process_compilation(self, job, mode):
+        """
+        Joins one hit of every found query entry, in query order, into a single video.
+        """
+        if mode == MODE_COPY:
+            # A stream-copied segment starts at its preceding keyframe, up to a GOP early.
+            self.log("Compilation uses smart cut instead of stream copy, so no segment starts before its subtitle.")
+            mode = MODE_SMART
+        segments, skipped = plan_compilation(self.main_app.query_output, self.video_files)
+        for ngram in skipped:
+            self.log(f"No loaded video for \"{ngram}\", left out of the compilation.")
+        if not segments:
+            self.log("No match found, nothing to compile.")
+            return
+        output_path = os.path.join(self.output_dir, f"compilation_{time.strftime('%Y%m%d_%H%M%S')}.mp4")
+        self.log(f"Compiling {len(segments)} segment(s), {sum(s['end'] - s['start'] for s in segments):.1f}s...")
+        try:
+            written, reason = compile_segments(segments, output_path, mode, on_progress=self.on_cut_progress,
+                                               cancel_event=job.cancel_event)
+        except (OSError, RuntimeError) as e:
+            self.log(f"Compilation failed: {e}")
+            return
+        how = f"re-encoded: {reason}" if reason else "no segment re-encoded"
+        self.log(f"Compilation saved: {output_path} ({written} segment(s), {how}).")
+
+    def on_cut_progress(self, done, total, message):
+        if message:
+            self.log(message)
+        self.events.progress(done / total * 100)
 
 # --- Main Application ---
 class MainApp(tk.Tk):
@@ -481,6 +612,46 @@ class MainApp(tk.Tk):
         notebook.add(self.query_tab, text="NGram Query")
         notebook.add(self.video_tab, text="Video Cutter")
         notebook.pack(fill="both", expand=True)
+        self.profiling = tk.BooleanVar(value=False)
+        menubar = tk.Menu(self)
+        metrics_menu = tk.Menu(menubar, tearoff=0)
+        metrics_menu.add_command(label="Save Metrics...", command=self.save_metrics)
+        metrics_menu.add_command(label="Reset Metrics", command=METRICS.reset)
+        metrics_menu.add_checkbutton(label="Profile Runs (cProfile)", variable=self.profiling)
+        menubar.add_cascade(label="Metrics", menu=metrics_menu)
+        self.config(menu=menubar)
+
+    # --- Instrumentation ---
+    def profile_file(self, stage):
+        """
+        cProfile output path for a run of stage, or None when profiling is off.
+        Reads a Tk variable, so it is called on the Tk thread.
+        """
+        if not self.profiling.get():
+            return None
+        return profile_path(stage, os.environ.get("NGRAM_PROFILE_DIR") or os.path.join(os.getcwd(), "profiles"))
+
+    def run_stage(self, stage, profile_file, job, func, *args):
+        """
+        Worker thread body: runs func(job, *args) timed as stage, under cProfile when profiling
+        is on, then dumps the metrics to $NGRAM_METRICS_FILE if it is set and marks the job finished.
+        """
+        try:
+            with profile(profile_file), METRICS.timer(stage):
+                func(job, *args)
+            export_metrics()
+        finally:
+            job.finished.set()
+
+    def save_metrics(self):
+        save_path = filedialog.asksaveasfilename(title="Save Metrics", defaultextension=".json",
+                                                 filetypes=[("JSON File", "*.json"),
+                                                            ("Prometheus Textfile", "*.prom")])
+        if save_path:
+            try:
+                METRICS.dump(save_path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not save the metrics: {e}")
 
 if __name__ == '__main__':
     app = MainApp()
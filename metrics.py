@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# --- Metrics Registry ---
+# Rates derived from a counter and a timer of the registry: {rate: (counter, timer)}.
+RATES = {
+    "files_per_second": ("srt_files", "process_files"),
+    "ngrams_per_second": ("ngrams", "process_files"),
+    "lookups_per_second": ("lookups", "search_ngrams"),
+    "encode_fps": ("encoded_frames", "cut_clips")
+}
+METRIC_PREFIX = "ngram_"
+
+class Metrics:
+    """
+    Thread-safe registry of stage timers and counters.
+    A timer keeps the number of calls, the total and the longest duration of a stage.
+    Worker processes record into their own registry; snapshot()/delta() export what they
+    measured and merge() adds it to the parent's registry.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}    # {name: {"count": calls, "seconds": total, "max": longest}}
+        self.counters = {}  # {name: value}
+        self.started = time.time()
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds, count=1):
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = {"count": count, "seconds": seconds, "max": seconds}
+            else:
+                timer["count"] += count
+                timer["seconds"] += seconds
+                timer["max"] = max(timer["max"], seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {"timers": {name: dict(timer) for name, timer in self.timers.items()},
+                    "counters": dict(self.counters)}
+
+    def delta(self, before):
+        """
+        What was recorded since the snapshot before, in snapshot form ("max" is the overall max).
+        """
+        now = self.snapshot()
+        timers = {}
+        for name, timer in now["timers"].items():
+            old = before["timers"].get(name, {"count": 0, "seconds": 0.0})
+            if timer["count"] != old["count"]:
+                timers[name] = {"count": timer["count"] - old["count"], "seconds": timer["seconds"] - old["seconds"],
+                                "max": timer["max"]}
+        counters = {name: value - before["counters"].get(name, 0) for name, value in now["counters"].items()
+                    if value != before["counters"].get(name, 0)}
+        return {"timers": timers, "counters": counters}
+
+    def merge(self, snapshot):
+        if not snapshot:
+            return
+        for name, timer in snapshot["timers"].items():
+            self.observe(name, timer["seconds"], timer["count"])
+            with self._lock:
+                self.timers[name]["max"] = max(self.timers[name]["max"], timer["max"])
+        for name, value in snapshot["counters"].items():
+            self.count(name, value)
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+    def rates(self):
+        snapshot = self.snapshot()
+        rates = {}
+        for rate, (counter, timer) in RATES.items():
+            seconds = snapshot["timers"].get(timer, {}).get("seconds")
+            if seconds and counter in snapshot["counters"]:
+                rates[rate] = snapshot["counters"][counter] / seconds
+        return rates
+
+    # --- Export ---
+    def to_json(self):
+        data = self.snapshot()
+        data["rates"] = self.rates()
+        data["started"] = self.started
+        data["written"] = time.time()
+        return json.dumps(data, indent=2)
+
+    def to_prometheus(self):
+        """
+        Prometheus text exposition format, for the node_exporter textfile collector.
+        """
+        snapshot = self.snapshot()
+        timers = sorted(snapshot["timers"].items())
+        lines = []
+        # Samples of one metric family have to be grouped under its TYPE line.
+        for family, kind, field, fmt in (("stage_seconds_total", "counter", "seconds", "{:.6f}"),
+                                         ("stage_calls_total", "counter", "count", "{}"),
+                                         ("stage_max_seconds", "gauge", "max", "{:.6f}")):
+            lines.append(f"# TYPE {METRIC_PREFIX}{family} {kind}")
+            for name, timer in timers:
+                lines.append(f'{METRIC_PREFIX}{family}{{stage="{name}"}} ' + fmt.format(timer[field]))
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{name}_total counter")
+            lines.append(f"{METRIC_PREFIX}{name}_total {value}")
+        for rate, value in sorted(self.rates().items()):
+            lines.append(f"# TYPE {METRIC_PREFIX}{rate} gauge")
+            lines.append(f"{METRIC_PREFIX}{rate} {value:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Writes the metrics atomically; ".prom" files get the Prometheus format, anything else JSON.
+        """
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return path
+
+METRICS = Metrics()
+
+# --- Profiling ---
+@contextmanager
+def profile(path=None, top=30):
+    """
+    Runs the block under cProfile when a path is given (a no-op otherwise) and writes the
+    raw stats to path and the top functions by cumulative time to "<path>.txt".
+    cProfile only sees the calling thread, so this wraps the body of a worker thread.
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        with open(path + ".txt", 'w', encoding='utf-8') as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(top)
+
+def profile_path(stage, folder=None):
+    """
+    Profile output path of a stage run in folder (default: $NGRAM_PROFILE_DIR), or None
+    when no folder is set, i.e. profiling is off.
+    """
+    folder = folder or os.environ.get("NGRAM_PROFILE_DIR")
+    if not folder:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{stage}_{time.strftime('%Y%m%d_%H%M%S')}.prof")
+
+def export_metrics(path=None):
+    """
+    Dumps METRICS to path (default: $NGRAM_METRICS_FILE); does nothing when neither is set.
+    """
+    path = path or os.environ.get("NGRAM_METRICS_FILE")
+    if path:
+        METRICS.dump(path)
+    return path
@@ -0,0 +1,466 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ngram_index import INDEX_EXTENSION, write_ngram_index
+from compact_ngrams import CompactNGramDict
+from build_cache import BuildCache, file_digest
+from phrase_index import PHRASE_EXTENSION, PhraseIndex
+from metrics import METRICS, profile
+
+WORD_PATTERN = re.compile(r'\b\w+\b', flags=re.UNICODE)
+
+# --- SRT Parsing ---
+TIME_PATTERN = re.compile(r'(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})')
+TIMING_PATTERN = re.compile(r'(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})')
+
+def _to_seconds(h, m, s, ms):
+    # "5" and "50" in the millisecond field are fractions of a second (.5 and .50).
+    # Dividing the total milliseconds once gives the same float for every representation
+    # that stores milliseconds (.ngi indexes, compact dictionaries).
+    return (((int(h) * 60 + int(m)) * 60 + int(s)) * 1000 + int(ms.ljust(3, '0'))) / 1000
+
+def srt_time_to_seconds(srt_time):
+    """
+    Converts the time in SRT format to seconds.
+    Example: "00:03:08,480" -> 188.48
+    """
+    match = TIME_PATTERN.search(srt_time)
+    if match is None:
+        raise ValueError(f"Invalid SRT time: {srt_time!r}")
+    return _to_seconds(*match.groups())
+
+def iter_srt(lines):
+    """
+    Incrementally parses SRT lines (any iterable of strings, e.g. an open file) and yields
+    each subtitle block as (start time, end time, text).
+    A block starts at its timing line, so missing or whitespace-only separators, CRLF line
+    endings, a leading BOM and concatenated files are tolerated; text without a timing line
+    is skipped.
+    """
+    start_time = end_time = None
+    text_lines = []
+    first = True
+    for line in lines:
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        line = line.strip()
+        if not line:
+            if start_time is not None and text_lines:
+                yield start_time, end_time, " ".join(text_lines)
+                start_time = None
+                text_lines = []
+            continue
+        match = TIMING_PATTERN.match(line)
+        if match is None:
+            if start_time is not None:
+                text_lines.append(line)
+            continue
+        # A timing line inside a block means the separator was missing; a trailing number is
+        # the next block's counter, not text.
+        if text_lines and text_lines[-1].isdigit():
+            text_lines.pop()
+        if start_time is not None and text_lines:
+            yield start_time, end_time, " ".join(text_lines)
+        groups = match.groups()
+        start_time = _to_seconds(*groups[:4])
+        end_time = _to_seconds(*groups[4:])
+        text_lines = []
+    if start_time is not None and text_lines:
+        yield start_time, end_time, " ".join(text_lines)
+
+def iter_srt_file(file_path):
+    """
+    Streams the subtitle blocks of an SRT file without reading it into memory.
+    """
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        yield from iter_srt(f)
+
+def parse_srt(content):
+    """
+    Takes SRT content and returns a list containing each subtitle block
+    (start time, end time, text).
+    """
+    return list(iter_srt(content.splitlines()))
+
+# --- NGram Extraction ---
+def extract_ngrams(subtitles, lowercase=True, compact=False):
+    """
+    Builds the ngram dictionary {ngram: [start times]} from (start, end, text) subtitle records.
+    Bigrams and trigrams never cross subtitle block boundaries.
+    With compact=True a CompactNGramDict (interned tokens, packed postings) is returned.
+    """
+    ngram_dict = CompactNGramDict() if compact else {}
+    for start_time, _end_time, text in subtitles:
+        if lowercase:
+            text = text.lower()
+        words = WORD_PATTERN.findall(text)
+        if compact:
+            ngram_dict.add_words(words, start_time)
+            continue
+        # Bigrams:
+        for i in range(len(words) - 1):
+            gram = words[i] + " " + words[i+1]
+            ngram_dict.setdefault(gram, []).append(start_time)
+        # Trigrams:
+        for i in range(len(words) - 2):
+            gram = words[i] + " " + words[i+1] + " " + words[i+2]
+            ngram_dict.setdefault(gram, []).append(start_time)
+    return ngram_dict
+
+def extract_phrase_index(subtitles, lowercase=True):
+    """
+    Builds a suffix-array PhraseIndex (arbitrary-length phrase matches) from subtitle records.
+    """
+    records = []
+    for start_time, _end_time, text in subtitles:
+        if lowercase:
+            text = text.lower()
+        records.append((start_time, WORD_PATTERN.findall(text)))
+    return PhraseIndex.from_word_lists(records)
+
+def source_base_name(file_path):
+    """
+    Returns the name used for the outputs of a source file ("ep01.srt" -> "ep01").
+    """
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def duplicate_base_names(file_paths):
+    """
+    Returns {base name: [paths]} for the sources that would write the same output files
+    (e.g. "s1/ep01.srt" and "s2/ep01.srt"); empty when every base name is unique.
+    """
+    paths_by_base = {}
+    for file_path in file_paths:
+        paths_by_base.setdefault(source_base_name(file_path), []).append(file_path)
+    return {base: paths for base, paths in paths_by_base.items() if len(paths) > 1}
+
+def _write_text(output_path, text):
+    # Written under a temporary name and renamed, so a reader never sees a partial file.
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, output_path)
+
+class _TimedRecords:
+    """
+    Iterates the records of a parser, adding up the time spent producing them.
+    """
+    def __init__(self, records):
+        self._records = iter(records)
+        self.seconds = 0.0
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            record = next(self._records)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.count += 1
+        return record
+
+def process_srt_file(file_path, lowercase=True, compact=False, phrases=False):
+    """
+    Streams and parses one SRT file and returns (base name, ngram dictionary), or
+    (base name, PhraseIndex) with phrases=True.
+    The parser feeds the extraction directly; the time spent inside the parser is recorded
+    as "parse_srt" and the rest as "extract_ngrams"/"extract_phrase_index".
+    """
+    subtitles = _TimedRecords(iter_srt_file(file_path))
+    stage = "extract_phrase_index" if phrases else "extract_ngrams"
+    start = time.perf_counter()
+    try:
+        if phrases:
+            result = extract_phrase_index(subtitles, lowercase)
+        else:
+            result = extract_ngrams(subtitles, lowercase, compact)
+    finally:
+        METRICS.observe("parse_srt", subtitles.seconds)
+        METRICS.observe(stage, time.perf_counter() - start - subtitles.seconds)
+        METRICS.count("subtitle_blocks", subtitles.count)
+    return source_base_name(file_path), result
+
+# --- Output Writers ---
+def format_detailed_output(ngram_dict, output_format="JSON"):
+    """
+    Returns (text, extension) of the detailed output for the given format ("JSON" or "TXT").
+    """
+    if output_format == "JSON":
+        if not isinstance(ngram_dict, dict):
+            ngram_dict = dict(ngram_dict.items())
+        return json.dumps(ngram_dict, ensure_ascii=False, indent=4), ".json"
+    lines = []
+    for gram, times in ngram_dict.items():
+        lines.append(f"{gram}: {times}")
+    return "\n".join(lines), ".txt"
+
+def format_plain_output(ngram_dict):
+    """
+    In the plain text output, only the ngram words (bigram and trigram) are included.
+    Each is enclosed in quotes and combined into a single, comma-separated line.
+    """
+    return ", ".join([f"\"{ng}\"" for ng in ngram_dict.keys()])
+
+def save_detailed_output(ngram_dict, output_folder, base_name, output_format="JSON"):
+    """
+    Writes "<base_name>_detailed.json/.txt/.ngi/.ngs" into the output folder and returns its path.
+    The NGS format needs a PhraseIndex built with process_srt_file(..., phrases=True).
+    """
+    if output_format == "NGS":
+        if not isinstance(ngram_dict, PhraseIndex):
+            raise ValueError("Phrase indexes are built from the SRT files; process them with the NGS format")
+        with METRICS.timer("write_phrase_index"):
+            return ngram_dict.save(os.path.join(output_folder, base_name + "_detailed" + PHRASE_EXTENSION))
+    if isinstance(ngram_dict, PhraseIndex):
+        raise ValueError("Phrase indexes can only be saved in the NGS format")
+    METRICS.count("ngrams_written", len(ngram_dict))
+    if output_format == "NGI":
+        with METRICS.timer("write_ngram_index"):
+            return write_ngram_index(ngram_dict, os.path.join(output_folder, base_name + "_detailed" + INDEX_EXTENSION))
+    with METRICS.timer("serialize_detailed"):
+        output_str, ext = format_detailed_output(ngram_dict, output_format)
+    output_path = os.path.join(output_folder, base_name + "_detailed" + ext)
+    with METRICS.timer("write_detailed"):
+        _write_text(output_path, output_str)
+    return output_path
+
+def save_plain_output(ngram_dict, output_folder, base_name):
+    """
+    Writes "<base_name>_plain.txt" into the output folder and returns its path.
+    """
+    output_path = os.path.join(output_folder, base_name + "_plain.txt")
+    with METRICS.timer("save_plain"):
+        _write_text(output_path, format_plain_output(ngram_dict))
+    return output_path
+
+# --- Batch Processing ---
+def _new_result(file_path):
+    return {"path": file_path, "base_name": source_base_name(file_path), "ngram_count": 0, "ngrams": None,
+            "outputs": {}, "error": None, "digest": None, "skipped": False, "phrases": False, "metrics": None}
+
+def _process_chunk(file_paths, lowercase, output_folder, output_format, write_plain, compact=False,
+                   known_digests=None, phrases=False):
+    """
+    Worker entry point: processes a chunk of SRT files inside a pool process.
+    When an output folder is given the outputs are written by the worker and only a
+    summary travels back to the parent, so large dictionaries are never pickled.
+    With known_digests ({path: digest}) every source is hashed first and skipped when its
+    content matches the digest recorded by the build cache.
+    With phrases=True (implied by the NGS format) a PhraseIndex is built instead of ngrams,
+    "ngram_count" then holds the number of indexed tokens and no plain output is written.
+    Stage timings and counters recorded while processing a file are returned in "metrics".
+    """
+    phrases = phrases or output_format == "NGS"
+    results = []
+    for file_path in file_paths:
+        result = _new_result(file_path)
+        result["phrases"] = phrases
+        before = METRICS.snapshot()
+        try:
+            if known_digests is not None:
+                with METRICS.timer("hash_source"):
+                    result["digest"] = file_digest(file_path)
+                if known_digests.get(file_path) == result["digest"]:
+                    result["skipped"] = True
+                    result["metrics"] = METRICS.delta(before)
+                    results.append(result)
+                    continue
+            base_name, ngram_dict = process_srt_file(file_path, lowercase, compact and output_folder is None,
+                                                     phrases)
+            result["ngram_count"] = ngram_dict.token_count if phrases else len(ngram_dict)
+            if output_folder is None:
+                result["ngrams"] = ngram_dict
+            else:
+                result["outputs"]["detailed"] = save_detailed_output(ngram_dict, output_folder, base_name,
+                                                                     output_format)
+                if write_plain and not phrases:
+                    result["outputs"]["plain"] = save_plain_output(ngram_dict, output_folder, base_name)
+        except Exception as e:
+            result["error"] = str(e)
+        result["metrics"] = METRICS.delta(before)
+        results.append(result)
+    return results
+
+def default_chunk_size(file_count, workers):
+    """
+    Splits the files into roughly four chunks per worker, which keeps every process busy
+    without paying one round trip per file.
+    """
+    return max(1, file_count // (workers * 4))
+
+def build_options(lowercase, output_format):
+    """
+    Options recorded in the build cache; a change in any of them invalidates the outputs.
+    """
+    return {"lowercase": bool(lowercase), "format": output_format}
+
+def _run_chunks(file_paths, workers, chunk_size, *args, phrases=False):
+    if not file_paths:
+        return
+    chunk_size = chunk_size or default_chunk_size(len(file_paths), workers)
+    chunks = [file_paths[i:i + chunk_size] for i in range(0, len(file_paths), chunk_size)]
+    if workers == 1:
+        # In-process chunks already recorded their metrics into this registry.
+        for chunk in chunks:
+            yield from _process_chunk(chunk, *args, phrases=phrases)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [executor.submit(_process_chunk, chunk, *args, phrases=phrases) for chunk in chunks]
+        try:
+            for future in as_completed(futures):
+                for result in future.result():
+                    METRICS.merge(result["metrics"])
+                    yield result
+        finally:
+            # When the consumer stops early (cancel), chunks that have not started are dropped.
+            for future in futures:
+                future.cancel()
+
+def process_srt_files(file_paths, lowercase=True, workers=None, chunk_size=None,
+                      output_folder=None, output_format="JSON", write_plain=False, compact=False,
+                      use_cache=False, force=False, phrases=False):
+    """
+    Processes SRT files on a ProcessPoolExecutor and yields one result dict per file
+    (path, base_name, ngram_count, ngrams, outputs, error, digest, skipped, metrics) as soon as its
+    chunk finishes. "ngrams" is only filled in when no output folder is given; compact=True
+    returns them as CompactNGramDict objects, which are also much cheaper to send between
+    processes.
+    With use_cache=True (output folder required) sources whose content and options match
+    the folder's build cache are skipped and reported with skipped=True; force=True
+    re-extracts everything but still updates the cache.
+    phrases=True (or the NGS format) builds suffix-array phrase indexes instead of ngrams.
+    Outputs are named after the source's base name, so with an output folder sources that
+    share a base name are rejected with ValueError before any of them is processed.
+    """
+    file_paths = list(file_paths)
+    if not file_paths:
+        return
+    if output_folder is not None:
+        duplicates = duplicate_base_names(file_paths)
+        if duplicates:
+            raise ValueError("Sources with the same name would overwrite each other's outputs: "
+                             + "; ".join(", ".join(paths) for paths in duplicates.values()))
+    workers = workers or os.cpu_count() or 1
+    if output_folder is not None:
+        os.makedirs(output_folder, exist_ok=True)
+    if not use_cache or output_folder is None:
+        yield from _run_chunks(file_paths, workers, chunk_size, lowercase, output_folder, output_format,
+                               write_plain, compact, phrases=phrases)
+        return
+
+    cache = BuildCache(output_folder)
+    options = build_options(lowercase, output_format)
+    required_outputs = ["detailed", "plain"] if write_plain and output_format != "NGS" else ["detailed"]
+    pending = []
+    known_digests = {}
+    for file_path in file_paths:
+        if force:
+            pending.append(file_path)
+            continue
+        if cache.is_unchanged(file_path, options, required_outputs):
+            result = _new_result(file_path)
+            result["skipped"] = True
+            yield result
+            continue
+        digest = cache.candidate_digest(file_path, options, required_outputs)
+        if digest is not None:
+            known_digests[file_path] = digest
+        pending.append(file_path)
+    try:
+        for done, result in enumerate(_run_chunks(pending, workers, chunk_size, lowercase, output_folder,
+                                                  output_format, write_plain, compact, known_digests,
+                                                  phrases=phrases), start=1):
+            if result["skipped"]:
+                cache.touch(result["path"])
+            elif not result["error"]:
+                cache.record(result["path"], result["digest"], options, result["outputs"])
+            if done % 100 == 0:
+                cache.save()
+            yield result
+    finally:
+        cache.save()
+
+def collect_srt_paths(paths):
+    """
+    Expands the given files and directories (searched recursively) into a sorted list of SRT files.
+    """
+    srt_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dirs, files in os.walk(path):
+                for name in files:
+                    if name.lower().endswith(".srt"):
+                        srt_paths.append(os.path.join(root, name))
+        else:
+            srt_paths.append(path)
+    return sorted(srt_paths)
+
+# --- Command Line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless ngram extraction for SRT corpora.")
+    parser.add_argument("inputs", nargs="+", help="SRT files or directories containing SRT files")
+    parser.add_argument("-o", "--output-dir", default=os.path.join(os.getcwd(), "ngram_outputs"),
+                        help="output folder (default: ./ngram_outputs)")
+    parser.add_argument("-f", "--format", choices=["JSON", "TXT", "NGI", "NGS"], default="JSON",
+                        help="format of the detailed output; NGI is the binary ngram index, NGS the "
+                             "suffix-array phrase index (default: JSON)")
+    parser.add_argument("--no-plain", action="store_true", help="do not write the _plain.txt outputs")
+    parser.add_argument("--case-sensitive", action="store_true", help="do not convert the text to lowercase")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="files handed to a worker at a time (default: automatic)")
+    parser.add_argument("--force", action="store_true",
+                        help="ignore the build cache and re-extract every file")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="write stage timings and counters to PATH (.prom: Prometheus textfile, else JSON)")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="run under cProfile and write the stats to PATH (and a summary to PATH.txt); "
+                             "use -j 1 to profile the extraction itself")
+    args = parser.parse_args(argv)
+
+    file_paths = collect_srt_paths(args.inputs)
+    if not file_paths:
+        print("No SRT files found.", file=sys.stderr)
+        return 1
+    duplicates = duplicate_base_names(file_paths)
+    if duplicates:
+        print("These SRT files share a name and would overwrite each other's outputs; "
+              "rename them or process them into separate output folders:", file=sys.stderr)
+        for paths in duplicates.values():
+            print("  " + ", ".join(paths), file=sys.stderr)
+        return 1
+    errors = 0
+    skipped = 0
+    with profile(args.profile), METRICS.timer("process_files"):
+        for done, result in enumerate(process_srt_files(file_paths, lowercase=not args.case_sensitive,
+                                                       workers=args.workers, chunk_size=args.chunk_size,
+                                                       output_folder=args.output_dir, output_format=args.format,
+                                                       write_plain=not args.no_plain, use_cache=True,
+                                                       force=args.force), start=1):
+            if result["skipped"]:
+                skipped += 1
+            elif result["error"]:
+                errors += 1
+                print(f"[{done}/{len(file_paths)}] Error {result['path']}: {result['error']}", file=sys.stderr)
+            else:
+                METRICS.count("srt_files")
+                METRICS.count("ngrams", result["ngram_count"])
+                found = "tokens indexed" if result["phrases"] else "ngrams found"
+                print(f"[{done}/{len(file_paths)}] {result['base_name']} file processed. "
+                      f"{result['ngram_count']} {found}.")
+    print(f"All files processed. {skipped} unchanged file(s) skipped, {errors} error(s).")
+    if args.metrics:
+        METRICS.dump(args.metrics)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import os
+import sys
+import ast
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from collections.abc import Mapping
+from compact_ngrams import CompactNGramDict
+from phrase_index import PHRASE_EXTENSION, PhraseIndex
+
+# --- Binary NGram Index (.ngi) ---
+# Layout (little-endian):
+#   header          magic "NGI1", version (uint32), ngram count N (uint64), posting count P (uint64)
+#   key offsets     (N + 1) x uint64, byte offsets into the key blob
+#   posting offsets (N + 1) x uint64, element offsets into the posting array
+#   postings        P x uint32, timestamps in milliseconds (SRT precision, stored exactly)
+#   key blob        UTF-8 ngrams sorted by their encoded bytes
+INDEX_MAGIC = b"NGI1"
+INDEX_VERSION = 1
+INDEX_EXTENSION = ".ngi"
+HEADER = struct.Struct("<4sIQQ")
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+def write_ngram_index(ngram_dict, path):
+    """
+    Writes an ngram dictionary {ngram: [start times]} as a binary .ngi index.
+    """
+    entries = sorted((gram.encode("utf-8"), times) for gram, times in ngram_dict.items())
+    key_offsets = array("Q", [0])
+    posting_offsets = array("Q", [0])
+    postings = array("I")
+    for key, times in entries:
+        key_offsets.append(key_offsets[-1] + len(key))
+        postings.extend(int(round(t * 1000)) for t in times)
+        posting_offsets.append(len(postings))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(entries), len(postings)))
+        f.write(_little_endian(key_offsets).tobytes())
+        f.write(_little_endian(posting_offsets).tobytes())
+        f.write(_little_endian(postings).tobytes())
+        for key, _times in entries:
+            f.write(key)
+    os.replace(tmp_path, path)
+    return path
+
+class NGramIndex(Mapping):
+    """
+    Read-only, dict-like view over a memory-mapped .ngi file.
+    Opening is O(1); a lookup is a binary search over the sorted key table and only
+    decodes the postings of the requested ngram.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            self._file.close()
+            raise ValueError(f"{os.path.basename(path)} is not an ngram index")
+        magic, version, self._count, posting_count = HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"{os.path.basename(path)} is not a version {INDEX_VERSION} ngram index")
+        pos = HEADER.size
+        self._key_offsets = self._view(pos, "Q", self._count + 1)
+        pos += (self._count + 1) * 8
+        self._posting_offsets = self._view(pos, "Q", self._count + 1)
+        pos += (self._count + 1) * 8
+        self._postings = self._view(pos, "I", posting_count)
+        self._keys_start = pos + posting_count * 4
+
+    def _view(self, offset, typecode, count):
+        size = array(typecode).itemsize * count
+        if sys.byteorder == "little":
+            return memoryview(self._mm)[offset:offset + size].cast(typecode)
+        values = array(typecode, self._mm[offset:offset + size])
+        values.byteswap()
+        return values
+
+    def _key_at(self, i):
+        return self._mm[self._keys_start + self._key_offsets[i]:self._keys_start + self._key_offsets[i + 1]]
+
+    def _find(self, gram):
+        key = gram.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key_at(lo) == key:
+            return lo
+        return -1
+
+    def __getitem__(self, gram):
+        i = self._find(gram) if isinstance(gram, str) else -1
+        if i < 0:
+            raise KeyError(gram)
+        return [ms / 1000 for ms in self._postings[self._posting_offsets[i]:self._posting_offsets[i + 1]]]
+
+    def __contains__(self, gram):
+        return isinstance(gram, str) and self._find(gram) >= 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._key_at(i).decode("utf-8")
+
+    def close(self):
+        # Views into the map must be released before it can be closed.
+        for name in ("_key_offsets", "_posting_offsets", "_postings"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Detailed Output Loading and Conversion ---
+def _parse_times(text):
+    """
+    Parses a "[1.5, 2.25]" timestamp list from a TXT detailed output line without eval().
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        try:
+            return ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return []
+
+def load_detailed_output(path, compact=False, tokens=None):
+    """
+    Loads a detailed output (.json, .txt or .ngi) and returns a dict-like ngram mapping.
+    .ngi files are memory-mapped and should be closed when no longer needed.
+    .ngs phrase indexes are returned as a PhraseIndex, which is not a mapping.
+    With compact=True JSON/TXT outputs are kept as a CompactNGramDict when possible,
+    interning its words in the given TokenTable (a new one by default).
+    """
+    lower = path.lower()
+    if lower.endswith(INDEX_EXTENSION):
+        return NGramIndex(path)
+    if lower.endswith(PHRASE_EXTENSION):
+        return PhraseIndex.load(path)
+    if lower.endswith(".json"):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    else:
+        data = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if ": " in line:
+                    key, value = line.strip().split(": ", 1)
+                    data[key] = _parse_times(value)
+    if compact:
+        try:
+            return CompactNGramDict.from_mapping(data, tokens)
+        except ValueError:
+            pass
+    return data
+
+def convert_output_file(path, output_path=None):
+    """
+    Converts a JSON/TXT detailed output into a .ngi index next to it and returns the new path.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(path)[0] + INDEX_EXTENSION
+    return write_ngram_index(load_detailed_output(path), output_path)
+
+# --- Command Line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert _detailed JSON/TXT outputs into binary .ngi indexes.")
+    parser.add_argument("inputs", nargs="+", help="_detailed.json or _detailed.txt files")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="folder for the .ngi files (default: next to each input)")
+    args = parser.parse_args(argv)
+
+    errors = 0
+    for path in args.inputs:
+        output_path = None
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            output_path = os.path.join(args.output_dir,
+                                       os.path.splitext(os.path.basename(path))[0] + INDEX_EXTENSION)
+        try:
+            print(f"Index saved: {convert_output_file(path, output_path)}")
+        except Exception as e:
+            errors += 1
+            print(f"Error converting {path}: {e}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,337 @@
+import os
+import re
+import sys
+import json
+import argparse
+import threading
+from collections import deque
+from corpus_index import CorpusIndex
+from phrase_index import PhraseCorpus, PhraseIndex
+from ngram_index import load_detailed_output
+from fuzzy_index import FuzzyIndex
+from metrics import METRICS, profile
+
+WORD_PATTERN = re.compile(r'\b\w+\b', flags=re.UNICODE)
+NGRAM_TYPES = {1: "unigram", 2: "bigram", 3: "trigram"}
+
+def tokenize_query(query, lowercase=True):
+    if lowercase:
+        query = query.lower()
+    return WORD_PATTERN.findall(query)
+
+def ngram_type(length):
+    return NGRAM_TYPES.get(length, f"{length}-gram")
+
+def make_result(words, i, length, matches):
+    """
+    One query_results entry: ngram, type, indices, matches, found.
+    """
+    return {
+        "ngram": " ".join(words[i:i+length]),
+        "type": ngram_type(length),
+        "indices": list(range(i, i+length)),
+        "matches": matches,
+        "found": bool(matches)
+    }
+
+class QueryEngine:
+    """
+    Answers query sentences against the loaded ngram outputs (merged CorpusIndex) and
+    phrase indexes (PhraseCorpus). Lookups are memoized until the loaded files change,
+    so a batch of sentences probes every distinct ngram only once. NOT FOUND segments can
+    be given suggestions from a FuzzyIndex over the loaded ngrams and phrase-index word
+    pairs. Once enable_suggestions() is called, the vocabulary of every loaded file is
+    queued for index_suggestions(); with background_suggestions=True the caller runs that on
+    a worker thread (suggestions cover what is indexed so far), otherwise suggest() runs it.
+    """
+    def __init__(self, background_suggestions=False):
+        self.corpus_index = CorpusIndex()
+        self.phrase_corpus = PhraseCorpus()
+        self.fuzzy_index = FuzzyIndex()
+        self.background_suggestions = background_suggestions
+        self.suggestions_enabled = False
+        self._fuzzy_pending = deque()  # ngram mappings and word pair lists waiting for fuzzy_index
+        self._fuzzy_active = 0
+        self._fuzzy_lock = threading.Lock()
+        self._memo = {}
+        self._longest = {}  # {words from a position on: longest phrase length there}
+        self.lookups = 0
+        self.memo_hits = 0
+
+    # --- Loaded Files ---
+    def load_file(self, path, compact=True):
+        """
+        Loads an output file (.json, .txt, .ngi or .ngs), replacing a file with the same name.
+        Returns the file name.
+        """
+        data = load_detailed_output(path, compact=compact, tokens=self.corpus_index.tokens)
+        fname = os.path.basename(path)
+        self.remove_file(fname)
+        if isinstance(data, PhraseIndex):
+            new_grams = [] if self.suggestions_enabled else None
+            self.phrase_corpus.add_file(fname, data, new_grams)
+            if new_grams:
+                self._fuzzy_pending.append(new_grams)
+        else:
+            self.corpus_index.add_file(fname, data)
+            if self.suggestions_enabled:
+                # The suggestion index skips the ngrams it already holds.
+                self._fuzzy_pending.append(data)
+        self.clear_memo()
+        return fname
+
+    def remove_file(self, fname):
+        # The fuzzy index keeps the file's ngrams; suggest() skips those no longer loaded.
+        data = self.corpus_index.remove_file(fname)
+        # Memory-mapped .ngi indexes keep their file open until closed.
+        if hasattr(data, "close"):
+            data.close()
+        self.phrase_corpus.remove_file(fname)
+        self.clear_memo()
+
+    def clear_memo(self):
+        self._memo.clear()
+        self._longest.clear()
+
+    @property
+    def filenames(self):
+        return self.corpus_index.filenames + self.phrase_corpus.filenames
+
+    # --- Lookups ---
+    def lookup(self, words):
+        """
+        Returns [(filename, timestamps), ...] for a phrase over all loaded files (memoized).
+        """
+        key = tuple(words)
+        self.lookups += 1
+        matches = self._memo.get(key)
+        if matches is not None:
+            self.memo_hits += 1
+            return matches
+        matches = self.corpus_index.lookup(" ".join(words)) if len(words) <= 3 else []
+        if self.phrase_corpus:
+            matches = matches + self.phrase_corpus.lookup(list(words))
+        self._memo[key] = matches
+        return matches
+
+    def longest_phrase(self, words, i):
+        """
+        Length of the longest phrase starting at words[i] in the loaded phrase indexes (memoized).
+        """
+        key = tuple(words[i:])
+        length = self._longest.get(key)
+        if length is None:
+            length = self._longest[key] = self.phrase_corpus.longest_length(words, i)
+        return length
+
+    def found_lengths(self, words, i):
+        """
+        Segment lengths (2 or more words) starting at words[i] that occur in some loaded file.
+        """
+        lengths = set()
+        if self.phrase_corpus:
+            # Every prefix of a phrase found in a phrase index is found as well.
+            lengths.update(range(2, self.longest_phrase(words, i) + 1))
+        for length in (2, 3):
+            if length not in lengths and i + length <= len(words) and self.lookup(words[i:i+length]):
+                lengths.add(length)
+        return lengths
+
+    # --- Suggestions ---
+    def enable_suggestions(self):
+        """
+        Queues the vocabulary of the files loaded so far for the suggestion index; files
+        loaded afterwards queue their new ngrams as they are loaded.
+        """
+        if not self.suggestions_enabled:
+            self.suggestions_enabled = True
+            self._fuzzy_pending.extend(self.corpus_index.mappings)
+            pairs = list(self.phrase_corpus)
+            if pairs:
+                self._fuzzy_pending.append(pairs)
+
+    def index_suggestions(self):
+        """
+        Adds the queued vocabulary to the suggestion index; returns the number of ngrams added.
+        Safe to run on a worker thread, also several at a time.
+        """
+        added = 0
+        with self._fuzzy_lock:
+            self._fuzzy_active += 1
+        try:
+            with METRICS.timer("index_suggestions"):
+                while True:
+                    try:
+                        grams = self._fuzzy_pending.popleft()
+                    except IndexError:
+                        break
+                    try:
+                        added += self.fuzzy_index.update(grams)
+                    except ValueError:
+                        # A memory-mapped .ngi index that was unloaded (and closed) meanwhile.
+                        pass
+        finally:
+            with self._fuzzy_lock:
+                self._fuzzy_active -= 1
+        return added
+
+    @property
+    def suggestions_ready(self):
+        with self._fuzzy_lock:
+            return self.suggestions_enabled and not self._fuzzy_pending and not self._fuzzy_active
+
+    def _is_loaded(self, gram):
+        return gram in self.corpus_index or gram in self.phrase_corpus
+
+    def suggest(self, text, k=3):
+        """
+        Returns up to k [(ngram, score), ...] loaded ngrams closest to text.
+        """
+        self.enable_suggestions()
+        if not self.background_suggestions:
+            self.index_suggestions()
+        return self.fuzzy_index.suggest(text, k, accept=self._is_loaded)
+
+    def add_suggestions(self, results, k=3):
+        """
+        Adds "suggestions": [{"ngram", "score"}, ...] to every NOT FOUND entry of query_results.
+        """
+        for res in results:
+            if not res["found"]:
+                res["suggestions"] = [{"ngram": gram, "score": score} for gram, score in self.suggest(res["ngram"], k)]
+        return results
+
+    # --- Segmentation ---
+    def segment_greedy(self, words):
+        """
+        Using a greedy approach, splits the words from left to right into segments:
+        - First, checks for the longest phrase (4 or more words) in the loaded phrase indexes.
+        - Then checks for trigrams.
+        - If not found, checks for bigrams.
+        - Whichever is found, that segment is taken and indices are skipped.
+        Unmatched words are recorded as NOT FOUND trigrams, bigrams or a unigram.
+        """
+        results = []
+        i = 0
+        while i < len(words):
+            if self.phrase_corpus and i <= len(words) - 4:
+                length = self.longest_phrase(words, i)
+                if length > 3:
+                    results.append(make_result(words, i, length, self.lookup(words[i:i+length])))
+                    i += length
+                    continue
+            found = False
+            for length in (3, 2):
+                if i <= len(words) - length:
+                    matches = self.lookup(words[i:i+length])
+                    if matches:
+                        results.append(make_result(words, i, length, matches))
+                        i += length
+                        found = True
+                        break
+            if found:
+                continue
+            length = min(3, len(words) - i)
+            results.append(make_result(words, i, length, []))
+            i += length
+        return results
+
+    def segment_optimal(self, words):
+        """
+        Dynamic programming segmentation. It minimizes, in order, the number of words left
+        in NOT FOUND segments, the number of NOT FOUND segments and the total number of
+        segments. Unmatched runs are split into NOT FOUND chunks of up to three words, like
+        the greedy search.
+        """
+        n = len(words)
+        best = [None] * (n + 1)
+        choice = [None] * (n + 1)
+        best[n] = (0, 0, 0)
+        for i in range(n - 1, -1, -1):
+            options = [(length, True) for length in sorted(self.found_lengths(words, i), reverse=True)]
+            options += [(length, False) for length in (3, 2, 1) if i + length <= n]
+            for length, found in options:
+                missing, misses, segments = best[i + length]
+                cost = (missing, misses, segments + 1) if found else (missing + length, misses + 1, segments + 1)
+                if best[i] is None or cost < best[i]:
+                    best[i] = cost
+                    choice[i] = (length, found)
+        results = []
+        i = 0
+        while i < n:
+            length, found = choice[i]
+            results.append(make_result(words, i, length, self.lookup(words[i:i+length]) if found else []))
+            i += length
+        return results
+
+    def segment(self, words, optimal=True):
+        """
+        Optimal or greedy segmentation, timed as the "search_ngrams" stage.
+        """
+        lookups = self.lookups
+        with METRICS.timer("search_ngrams"):
+            results = self.segment_optimal(words) if optimal else self.segment_greedy(words)
+        METRICS.count("queries")
+        METRICS.count("lookups", self.lookups - lookups)
+        return results
+
+    def query(self, sentence, lowercase=True, optimal=True, suggestions=0):
+        words = tokenize_query(sentence, lowercase)
+        results = self.segment(words, optimal)
+        if suggestions:
+            with METRICS.timer("suggest"):
+                self.add_suggestions(results, suggestions)
+        return results
+
+    def run_batch(self, sentences, lowercase=True, optimal=True, suggestions=0):
+        """
+        Yields (sentence, query_results) for every non-empty sentence, sharing the lookup memo.
+        """
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if sentence:
+                yield sentence, self.query(sentence, lowercase, optimal, suggestions)
+
+# --- Command Line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch ngram queries; writes one NDJSON line per sentence.")
+    parser.add_argument("sentences", help="text file with one query sentence per line ('-' for stdin)")
+    parser.add_argument("-i", "--index", nargs="+", required=True,
+                        help="output files to query (.json, .txt, .ngi or .ngs)")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--greedy", action="store_true",
+                        help="use the greedy trigram-then-bigram segmentation instead of the optimal one")
+    parser.add_argument("--suggest", type=int, default=0, metavar="K",
+                        help="add the K closest loaded ngrams to every NOT FOUND segment")
+    parser.add_argument("--case-sensitive", action="store_true", help="do not convert the queries to lowercase")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="write stage timings and counters to PATH (.prom: Prometheus textfile, else JSON)")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="run under cProfile and write the stats to PATH (and a summary to PATH.txt)")
+    args = parser.parse_args(argv)
+
+    engine = QueryEngine()
+    if args.suggest:
+        engine.enable_suggestions()
+    with METRICS.timer("load_output_files"):
+        for path in args.index:
+            engine.load_file(path)
+    source = sys.stdin if args.sentences == "-" else open(args.sentences, 'r', encoding='utf-8')
+    output = sys.stdout if args.output == "-" else open(args.output, 'w', encoding='utf-8')
+    try:
+        with profile(args.profile):
+            for sentence, results in engine.run_batch(source, not args.case_sensitive, not args.greedy,
+                                                        args.suggest):
+                output.write(json.dumps({"sentence": sentence, "query_results": results}, ensure_ascii=False) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    print(f"{engine.lookups} lookups, {engine.memo_hits} answered from the memo.", file=sys.stderr)
+    if args.metrics:
+        METRICS.dump(args.metrics)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+import os
+import sys
+import struct
+from array import array
+
+# --- Suffix Array Phrase Index (.ngs) ---
+# Each file's token stream is stored once (token id + 1, 0 separates subtitle blocks so
+# phrases never cross them), together with the start time of every token's subtitle,
+# the suffix array of the stream and its LCP array. Any phrase of any length is found by
+# narrowing the suffix array range one word at a time with binary searches.
+#
+# Layout (little-endian):
+#   header        magic "NGS1", version (uint32), vocabulary size V (uint64), stream length N (uint64),
+#                 vocabulary blob size (uint64)
+#   word offsets  (V + 1) x uint64 into the vocabulary blob
+#   stream        N x uint32
+#   times         N x uint32, milliseconds
+#   suffix array  N x uint32
+#   lcp           N x uint32, lcp[i] = common prefix of suffixes sa[i - 1] and sa[i]
+#   vocabulary    UTF-8 words
+PHRASE_MAGIC = b"NGS1"
+PHRASE_VERSION = 1
+PHRASE_EXTENSION = ".ngs"
+HEADER = struct.Struct("<4sIQQQ")
+SEPARATOR = 0
+SMALL_RANGE = 64  # ranges this small are extended through the LCP array instead of searched
+
+def build_suffix_array(stream):
+    """
+    Prefix-doubling suffix array construction, O(n log^2 n).
+    """
+    n = len(stream)
+    sa = list(range(n))
+    rank = list(stream)
+    k = 1
+    while True:
+        key = lambda i: (rank[i], rank[i + k] if i + k < n else -1)
+        sa.sort(key=key)
+        new_rank = [0] * n
+        for j in range(1, n):
+            new_rank[sa[j]] = new_rank[sa[j - 1]] + (key(sa[j - 1]) != key(sa[j]))
+        rank = new_rank
+        if n == 0 or rank[sa[-1]] == n - 1:
+            break
+        k *= 2
+    return array("I", sa)
+
+def build_lcp_array(stream, sa):
+    """
+    Kasai's algorithm: lcp[i] is the length of the common prefix of sa[i - 1] and sa[i].
+    """
+    n = len(stream)
+    rank = [0] * n
+    for i, pos in enumerate(sa):
+        rank[pos] = i
+    lcp = array("I", bytes(4 * n))
+    h = 0
+    for pos in range(n):
+        r = rank[pos]
+        if r == 0:
+            h = 0
+            continue
+        prev = sa[r - 1]
+        while pos + h < n and prev + h < n and stream[pos + h] == stream[prev + h] and stream[pos + h] != SEPARATOR:
+            h += 1
+        lcp[r] = h
+        if h:
+            h -= 1
+    return lcp
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+class PhraseIndex:
+    """
+    Suffix-array phrase index of one subtitle file.
+    """
+    def __init__(self, words, stream, times, sa, lcp):
+        self.words = words  # vocabulary, id -> word
+        self.word_ids = {word: i + 1 for i, word in enumerate(words)}
+        self.stream = stream
+        self.times = times
+        self.sa = sa
+        self.lcp = lcp
+
+    @classmethod
+    def from_word_lists(cls, records):
+        """
+        Builds the index from (start time, [words]) records, one per subtitle block.
+        """
+        words, word_ids = [], {}
+        stream, times = array("I"), array("I")
+        for start_time, block_words in records:
+            if not block_words:
+                continue
+            ms = int(round(start_time * 1000))
+            for word in block_words:
+                word_id = word_ids.get(word)
+                if word_id is None:
+                    words.append(word)
+                    word_id = word_ids[word] = len(words)
+                stream.append(word_id)
+                times.append(ms)
+            stream.append(SEPARATOR)
+            times.append(ms)
+        sa = build_suffix_array(stream)
+        return cls(words, stream, times, sa, build_lcp_array(stream, sa))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, version, vocab_size, n, blob_size = HEADER.unpack(f.read(HEADER.size))
+            if magic != PHRASE_MAGIC or version != PHRASE_VERSION:
+                raise ValueError(f"{os.path.basename(path)} is not a version {PHRASE_VERSION} phrase index")
+            offsets = cls._read_array(f, "Q", vocab_size + 1)
+            stream = cls._read_array(f, "I", n)
+            times = cls._read_array(f, "I", n)
+            sa = cls._read_array(f, "I", n)
+            lcp = cls._read_array(f, "I", n)
+            blob = f.read(blob_size)
+        words = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(vocab_size)]
+        return cls(words, stream, times, sa, lcp)
+
+    @staticmethod
+    def _read_array(f, typecode, count):
+        values = array(typecode)
+        values.frombytes(f.read(values.itemsize * count))
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def save(self, path):
+        encoded = [word.encode("utf-8") for word in self.words]
+        offsets = array("Q", [0])
+        for word in encoded:
+            offsets.append(offsets[-1] + len(word))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(PHRASE_MAGIC, PHRASE_VERSION, len(self.words), len(self.stream), offsets[-1]))
+            for values in (offsets, self.stream, self.times, self.sa, self.lcp):
+                f.write(_little_endian(values).tobytes())
+            f.write(b"".join(encoded))
+        os.replace(tmp_path, path)
+        return path
+
+    @property
+    def token_count(self):
+        return len(self.stream) - self.stream.count(SEPARATOR)
+
+    def _token(self, pos):
+        return self.stream[pos] if pos < len(self.stream) else -1
+
+    def _narrow(self, lo, hi, depth, token_id):
+        """
+        Returns the sub-range of [lo, hi) whose suffixes have token_id at offset depth.
+        """
+        sa, token = self.sa, self._token
+        a, b = lo, hi
+        while a < b:
+            mid = (a + b) // 2
+            if token(sa[mid] + depth) < token_id:
+                a = mid + 1
+            else:
+                b = mid
+        start = a
+        b = hi
+        while a < b:
+            mid = (a + b) // 2
+            if token(sa[mid] + depth) <= token_id:
+                a = mid + 1
+            else:
+                b = mid
+        return start, a
+
+    def _shared_depth(self, lo, hi):
+        """
+        Number of leading tokens shared by every suffix in [lo, hi), read from the LCP array.
+        """
+        if hi - lo == 1:
+            pos = self.sa[lo]
+            end = pos
+            while end < len(self.stream) and self.stream[end] != SEPARATOR:
+                end += 1
+            return end - pos
+        return min(self.lcp[lo + 1:hi])
+
+    def match_ranges(self, query_ids, i):
+        """
+        Yields (length, lo, hi) for every length of query_ids[i:] that occurs in the file,
+        shortest first; [lo, hi) is the suffix array range of its occurrences.
+        """
+        lo, hi = 0, len(self.sa)
+        depth = 0
+        while i + depth < len(query_ids) and query_ids[i + depth] is not None:
+            if hi - lo <= SMALL_RANGE:
+                # Every suffix in a small range shares the LCP minimum, so those words are
+                # compared against one suffix directly instead of searched.
+                shared = self._shared_depth(lo, hi)
+                pos = self.sa[lo]
+                if depth < shared:
+                    while (depth < shared and i + depth < len(query_ids)
+                           and query_ids[i + depth] == self.stream[pos + depth]):
+                        depth += 1
+                        yield depth, lo, hi
+                    if depth < shared:
+                        return
+                    continue
+            lo, hi = self._narrow(lo, hi, depth, query_ids[i + depth])
+            if lo >= hi:
+                return
+            depth += 1
+            yield depth, lo, hi
+
+    def query_ids(self, words):
+        return [self.word_ids.get(word) for word in words]
+
+    def occurrence_times(self, lo, hi):
+        """
+        Start times (seconds) of the occurrences in a suffix array range, in file order.
+        """
+        return [self.times[pos] / 1000 for pos in sorted(self.sa[lo:hi])]
+
+    def word_pairs(self):
+        """
+        Returns the distinct "word word" pairs of consecutive words (within a subtitle block).
+        """
+        words = self.words
+        return {words[a - 1] + " " + words[b - 1] for a, b in set(zip(self.stream, self.stream[1:])) if a and b}
+
+    def longest_length(self, words, i):
+        """
+        Returns the length of the longest phrase starting at words[i], without collecting times.
+        """
+        length = 0
+        for length, _lo, _hi in self.match_ranges(self.query_ids(words), i):
+            pass
+        return length
+
+    def lookup(self, phrase_words):
+        """
+        Returns the start times of an exact phrase, or [] when it does not occur.
+        """
+        for length, lo, hi in self.match_ranges(self.query_ids(phrase_words), 0):
+            if length == len(phrase_words):
+                return self.occurrence_times(lo, hi)
+        return []
+
+class PhraseCorpus:
+    """
+    The phrase indexes of all loaded files, with merged indexes of the words and word pairs
+    every file contains. A phrase only occurs in the files containing its first word pair
+    (or its word, for a single word), so only their suffix arrays are searched, and a phrase
+    that occurs nowhere costs a single dictionary probe regardless of how many files are loaded.
+    """
+    def __init__(self):
+        self.indexes = {}      # {filename: PhraseIndex}
+        self._pair_files = {}  # {"word word": [filename, ...]} in load order
+        self._word_files = {}  # {word: [filename, ...]} in load order
+
+    def add_file(self, fname, index, new_grams=None):
+        """
+        Adds a file's phrase index; word pairs no other loaded file contains are appended to
+        the new_grams list when one is given.
+        """
+        if fname in self.indexes:
+            self.remove_file(fname)
+        self.indexes[fname] = index
+        pair_files = self._pair_files
+        for pair in index.word_pairs():
+            fnames = pair_files.get(pair)
+            if fnames is None:
+                pair_files[pair] = [fname]
+                if new_grams is not None:
+                    new_grams.append(pair)
+            else:
+                fnames.append(fname)
+        word_files = self._word_files
+        for word in set(index.words):
+            word_files.setdefault(word, []).append(fname)
+
+    def remove_file(self, fname):
+        index = self.indexes.pop(fname, None)
+        if index is not None:
+            for merged, keys in ((self._pair_files, index.word_pairs()), (self._word_files, set(index.words))):
+                for key in keys:
+                    fnames = merged.get(key)
+                    if fnames is None:
+                        continue
+                    fnames.remove(fname)
+                    if not fnames:
+                        del merged[key]
+        return index
+
+    def _candidates(self, words, i):
+        """
+        (filename, PhraseIndex) of the files that can contain a phrase starting at words[i].
+        """
+        if i + 1 >= len(words):
+            fnames = self._word_files.get(words[i], ()) if i < len(words) else ()
+        else:
+            fnames = self._pair_files.get(words[i] + " " + words[i + 1], ())
+        return [(fname, self.indexes[fname]) for fname in fnames]
+
+    def __contains__(self, pair):
+        return pair in self._pair_files
+
+    def __iter__(self):
+        return iter(self._pair_files)
+
+    def __bool__(self):
+        return bool(self.indexes)
+
+    @property
+    def filenames(self):
+        return list(self.indexes)
+
+    def longest_length(self, words, i):
+        """
+        Returns the length of the longest phrase starting at words[i] over all files; a
+        single word without a following word pair in any file counts as 0.
+        """
+        return max((index.longest_length(words, i) for _fname, index in self._candidates(words, i)), default=0)
+
+    def lookup(self, phrase_words):
+        matches = []
+        for fname, index in self._candidates(phrase_words, 0):
+            times = index.lookup(phrase_words)
+            if times:
+                matches.append((fname, times))
+        return matches
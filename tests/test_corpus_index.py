@@ -0,0 +1,44 @@
+from compact_ngrams import CompactNGramDict
+from corpus_index import CorpusIndex
+
+def make_files(index, count, size):
+    files = []
+    for f in range(count):
+        # Half of every file's ngrams are shared with the other files.
+        mapping = {f"w{i} w{i + 1}": [float(i)] for i in range(size // 2)}
+        mapping.update({f"f{f} w{i} w{i + 2}": [i + 0.5] for i in range(size - size // 2)})
+        files.append(CompactNGramDict.from_mapping(mapping, index.tokens))
+    return files
+
+def test_merged_size_is_twelve_bytes_per_posting():
+    index = CorpusIndex()
+    files = make_files(index, 3, 20000)
+    for f, ngram_dict in enumerate(files):
+        index.add_file(f"f{f}.json", ngram_dict)
+    postings = sum(len(ngram_dict) for ngram_dict in files)
+    assert index.nbytes() == 12 * postings
+    assert len(index) == 10000 + 3 * 10000
+
+def test_lookup_keeps_load_order_across_merges_and_removals():
+    index = CorpusIndex()
+    files = make_files(index, 3, 100)
+    index.add_file("a.json", files[0])
+    assert index.lookup("w3 w4") == [("a.json", [3.0])]
+    index.add_file("b.json", files[1])
+    index.add_file("c.json", files[2])
+    assert [name for name, _times in index.lookup("w3 w4")] == ["a.json", "b.json", "c.json"]
+    index.remove_file("b.json")
+    assert [name for name, _times in index.lookup("w3 w4")] == ["a.json", "c.json"]
+    assert index.lookup("f1 w0 w2") == []
+    assert index.lookup("f2 w0 w2") == [("c.json", [0.5])]
+    assert "f1 w0 w2" not in index and "w3 w4" in index
+    assert index.nbytes() == 12 * (len(files[0]) + len(files[2]))
+
+def test_other_mappings_are_merged_with_packed_files():
+    index = CorpusIndex()
+    packed = make_files(index, 1, 10)[0]
+    index.add_file("plain.txt", {"w1 w2": [7.0], "solo": [8.0]})
+    index.add_file("packed.json", packed)
+    assert index.lookup("w1 w2") == [("plain.txt", [7.0]), ("packed.json", [1.0])]
+    assert index.lookup("solo") == [("plain.txt", [8.0])]
+    assert set(index) == set(packed) | {"solo"}
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip("moviepy")
+from video_cutter import plan_cut_tasks
+
+def test_same_second_matches_get_separate_files():
+    query_output = [{"ngram": "big brown", "type": "bigram", "found": True,
+                     "matches": [("ep01.json", [12.2, 12.7])]}]
+    groups, missing = plan_cut_tasks(query_output, {"ep01": "/videos/ep01.mp4"}, clip_length=3)
+    tasks = groups["/videos/ep01.mp4"]
+    assert missing == []
+    assert [(task["start"], task["end"]) for task in tasks] == [(12.2, 15.2), (12.7, 15.7)]
+    assert [task["output_filename"] for task in tasks] == ["ep01_bigram_0_12200.mp4",
+                                                           "ep01_bigram_0_12700.mp4"]
+    assert all(not task["aliases"] for task in tasks)
@@ -0,0 +1,90 @@
+import queue
+import threading
+
+FRAME_INTERVAL_MS = 50      # the queued events are applied 20 times per second
+MAX_LOG_LINES = 5000        # older lines are dropped from the log widget
+MAX_EVENTS_PER_FRAME = 20000
+
+class Job:
+    """
+    One background job of a tab. Workers poll cancelled (or pass cancel_event on) and stop
+    at the next safe point; finished is set by the thread running the job.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+class EventPump:
+    """
+    Thread-safe bridge from worker threads to a tab's log Text and Progressbar.
+    log() and progress() only queue the update; the Tk thread drains the queue every
+    interval_ms with after(), inserting all pending log lines at once and applying only the
+    latest progress value, and keeps the log to max_log_lines lines.
+    """
+    def __init__(self, widget, log_text, progress_bar, interval_ms=FRAME_INTERVAL_MS,
+                 max_log_lines=MAX_LOG_LINES):
+        self.widget = widget
+        self.log_text = log_text
+        self.progress_bar = progress_bar
+        self.interval_ms = interval_ms
+        self.max_log_lines = max_log_lines
+        self.job = None
+        self._lines = queue.SimpleQueue()
+        self._progress = None
+        self._lock = threading.Lock()
+        self.widget.after(self.interval_ms, self._drain)
+
+    # --- Worker Side (any thread) ---
+    def log(self, message):
+        self._lines.put(message)
+
+    def progress(self, value):
+        with self._lock:
+            self._progress = value
+
+    # --- Jobs (Tk thread) ---
+    @property
+    def job_running(self):
+        return self.job is not None and not self.job.finished.is_set()
+
+    def begin_job(self, name):
+        """
+        Returns a new Job, or None while the previous one is still running.
+        """
+        if self.job_running:
+            return None
+        self.job = Job(name)
+        return self.job
+
+    def cancel_job(self):
+        if self.job_running and not self.job.cancelled:
+            self.job.cancel()
+            self.log(f"Cancelling {self.job.name}...")
+
+    # --- Tk Side ---
+    def _drain(self):
+        lines = []
+        try:
+            while len(lines) < MAX_EVENTS_PER_FRAME:
+                lines.append(self._lines.get_nowait())
+        except queue.Empty:
+            pass
+        if lines:
+            self.log_text.insert("end", "\n".join(lines) + "\n")
+            line_count = int(self.log_text.index("end-1c").split(".")[0])
+            if line_count > self.max_log_lines:
+                self.log_text.delete("1.0", f"{line_count - self.max_log_lines}.0")
+            self.log_text.see("end")
+        with self._lock:
+            value, self._progress = self._progress, None
+        if value is not None:
+            self.progress_bar['value'] = value
+        self.widget.after(self.interval_ms, self._drain)
@@ -0,0 +1,794 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import subprocess
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from moviepy.video.io.VideoFileClip import VideoFileClip  # Current MoviePy import
+from clip_cache import place_file
+from cut_manifest import temp_clip_path, remove_partial_clips
+from metrics import METRICS
+from video_index import load_video_index
+
+# --- Cutting Modes ---
+MODE_REENCODE = "reencode"  # MoviePy decode + libx264/aac encode, frame accurate
+MODE_COPY = "copy"          # packet copy starting at the preceding keyframe, no re-encode
+MODE_SMART = "smart"        # re-encode only the partial GOP at the head, copy the rest
+CUT_MODES = {
+    "Re-encode (frame accurate)": MODE_REENCODE,
+    "Stream copy (keyframe snap)": MODE_COPY,
+    "Smart cut (re-encode head GOP)": MODE_SMART,
+}
+KEYFRAME_EPSILON = 0.001
+CLIP_LENGTH = 5  # seconds cut from every matched start time
+
+# Smart cut: the head GOP is encoded with the source's H.264 parameters, so only sources
+# whose profile and pixel format libx264 can reproduce are smart cut.
+X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+SMART_PIX_FMTS = ("yuv420p", "yuvj420p")
+SMART_CRF = 18  # the head is only a fraction of a second, so it is encoded near-transparently
+COLOR_OPTIONS = (("color_range", "-color_range"), ("color_space", "-colorspace"),
+                 ("color_primaries", "-color_primaries"), ("color_transfer", "-color_trc"))
+TS_CODECS = ("h264", "hevc")  # joined through MPEG-TS, which carries parameter sets in-band
+
+# A merged span is one ffmpeg process with an output per clip, and a failure re-encodes all
+# of its clips one by one, so spans are kept to a bounded length and clip count.
+MAX_SPAN_SECONDS = 60.0
+MAX_SPAN_CLIPS = 8
+
+# --- FFmpeg Helpers ---
+def ffmpeg_binary():
+    """
+    Returns the ffmpeg executable MoviePy uses (FFMPEG_BINARY setting), or the one on PATH.
+    """
+    binary = os.environ.get("FFMPEG_BINARY")
+    if binary and binary != "auto-detect":
+        return binary
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except Exception:
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+def ffprobe_binary():
+    """
+    Returns the ffprobe executable (FFPROBE_BINARY, PATH, or next to ffmpeg), or None.
+    """
+    binary = os.environ.get("FFPROBE_BINARY") or shutil.which("ffprobe")
+    if binary:
+        return binary
+    ffmpeg = ffmpeg_binary()
+    folder, name = os.path.split(ffmpeg)
+    if folder and "ffmpeg" in name:
+        candidate = os.path.join(folder, name.replace("ffmpeg", "ffprobe"))
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def _run(command):
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise RuntimeError(f"Could not run {command[0]}: {e}")
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(error[-1] if error else f"{os.path.basename(command[0])} failed")
+    return result.stdout.decode("utf-8", "replace")
+
+def run_ffmpeg(args):
+    return _run([ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"] + args)
+
+def run_ffprobe(args):
+    binary = ffprobe_binary()
+    if binary is None:
+        raise RuntimeError("ffprobe was not found (set FFPROBE_BINARY or add it to PATH)")
+    return _run([binary, "-v", "error"] + args)
+
+def probe_video(path):
+    """
+    Returns {"duration": seconds, "streams": [ffprobe stream dicts]} for a video file.
+    """
+    data = json.loads(run_ffprobe(["-show_format", "-show_streams", "-of", "json", path]))
+    duration = float(data.get("format", {}).get("duration") or 0)
+    return {"duration": duration, "streams": data.get("streams", [])}
+
+def probe_keyframes(path):
+    """
+    Returns the sorted [timestamp (seconds), byte offset] of every keyframe of the first
+    video stream; the offset is -1 when the container does not report it.
+    Only packet headers are read, nothing is decoded.
+    """
+    # csv fields follow ffprobe's packet section order, not the order requested.
+    output = run_ffprobe(["-select_streams", "v:0", "-show_entries", "packet=pts_time,pos,flags",
+                          "-of", "csv=print_section=0", path])
+    keyframes = []
+    for line in output.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) >= 3 and "K" in parts[2] and parts[0] not in ("", "N/A"):
+            keyframes.append([float(parts[0]), int(parts[1]) if parts[1].isdigit() else -1])
+    keyframes.sort()
+    return keyframes
+
+def video_stream(info):
+    for stream in info["streams"]:
+        if stream.get("codec_type") == "video":
+            return stream
+    return None
+
+def video_codec(info):
+    stream = video_stream(info)
+    return stream.get("codec_name") if stream else None
+
+def video_timescale(info):
+    """
+    Time scale of the first video stream ("1/12800" -> 12800), or None.
+    """
+    stream = video_stream(info) or {}
+    _num, _sep, den = (stream.get("time_base") or "").partition("/")
+    return int(den) if den.isdigit() and int(den) > 0 else None
+
+def video_frame_rate(info):
+    """
+    Average frame rate of the first video stream ("30000/1001" -> 29.97), or None.
+    """
+    for stream in info["streams"]:
+        if stream.get("codec_type") == "video":
+            for key in ("avg_frame_rate", "r_frame_rate"):
+                num, _sep, den = (stream.get(key) or "").partition("/")
+                try:
+                    rate = float(num) / float(den or 1)
+                except (ValueError, ZeroDivisionError):
+                    continue
+                if rate > 0:
+                    return rate
+    return None
+
+def keyframe_at_or_before(keyframes, t):
+    i = bisect_right(keyframes, t + KEYFRAME_EPSILON)
+    return keyframes[i - 1] if i else 0.0
+
+def keyframe_after(keyframes, t):
+    i = bisect_right(keyframes, t + KEYFRAME_EPSILON)
+    return keyframes[i] if i < len(keyframes) else None
+
+# --- Cut Backends ---
+def cut_copy(video_path, start, end, output_path, keyframes):
+    """
+    Remuxes [start, end] without re-encoding. The start snaps to the preceding keyframe,
+    which is returned.
+    """
+    snapped = keyframe_at_or_before(keyframes, start)
+    run_ffmpeg(["-ss", f"{snapped:.3f}", "-i", video_path, "-t", f"{end - snapped:.3f}",
+                "-map", "0:v?", "-map", "0:a?", "-c", "copy", "-avoid_negative_ts", "make_zero",
+                output_path])
+    return snapped
+
+def cut_span_reencode(video_path, span_start, clips):
+    """
+    Decodes a span once and encodes every clip [(start, end, output_path), ...] inside it
+    as a separate ffmpeg output (libx264/aac), instead of decoding each clip on its own.
+    """
+    args = ["-ss", f"{span_start:.3f}", "-i", video_path]
+    for start, end, output_path in clips:
+        args += ["-ss", f"{start - span_start:.3f}", "-t", f"{end - start:.3f}",
+                 "-map", "0:v?", "-map", "0:a?", "-c:v", "libx264", "-c:a", "aac", output_path]
+    run_ffmpeg(args)
+
+def _write_concat_list(list_path, part_paths, durations=None):
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for n, part in enumerate(part_paths):
+            escaped = os.path.abspath(part).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if durations and durations[n] is not None:
+                f.write(f"duration {durations[n]:.6f}\n")
+
+def concat_copy(part_paths, output_path, codec=None, timescale=None):
+    """
+    Concatenates compatible parts with the concat demuxer, without re-encoding.
+    MP4 keeps a single set of H.264/HEVC parameter sets per track, taken from the first
+    part, so with codec "h264"/"hevc" every part is first remuxed to MPEG-TS (annex-B with
+    its own parameter sets in-band) and later parts are decoded with their own SPS/PPS.
+    timescale sets the video track time scale of the output (the source's, for example).
+    """
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(output_path) or None)
+    try:
+        if codec in TS_CODECS:
+            remuxed = []
+            for n, part in enumerate(part_paths):
+                ts_path = os.path.join(tmp_dir, f"{n:05d}.ts")
+                run_ffmpeg(["-i", part, "-map", "0:v?", "-map", "0:a?", "-c", "copy", "-f", "mpegts", ts_path])
+                remuxed.append(ts_path)
+            part_paths = remuxed
+        list_path = os.path.join(tmp_dir, "parts.txt")
+        _write_concat_list(list_path, part_paths)
+        args = ["-f", "concat", "-safe", "0", "-i", list_path, "-map", "0:v?", "-map", "0:a?", "-c", "copy"]
+        if timescale:
+            args += ["-video_track_timescale", str(timescale)]
+        run_ffmpeg(args + [output_path])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def smart_cut_incompatibility(info):
+    """
+    Returns why a source cannot be smart cut, or None when its head GOP can be re-encoded
+    with parameters that match the stream-copied rest: progressive 8-bit 4:2:0 H.264 in a
+    profile libx264 produces.
+    """
+    stream = video_stream(info)
+    if stream is None:
+        return "smart cut needs a video stream"
+    if stream.get("codec_name") != "h264":
+        return f"smart cut needs H.264, source is {stream.get('codec_name')}"
+    if stream.get("profile") not in X264_PROFILES:
+        return f"smart cut cannot match the H.264 {stream.get('profile')} profile"
+    if stream.get("pix_fmt") not in SMART_PIX_FMTS:
+        return f"smart cut cannot match the {stream.get('pix_fmt')} pixel format"
+    if stream.get("field_order") not in (None, "progressive", "unknown"):
+        return "smart cut cannot match interlaced video"
+    return None
+
+def matching_encode_args(info):
+    """
+    libx264 options that reproduce the source's profile, level, pixel format, B-frame use
+    and color description, so the re-encoded head decodes like the copied tail.
+    """
+    stream = video_stream(info)
+    args = ["-c:v", "libx264", "-crf", str(SMART_CRF), "-profile:v", X264_PROFILES[stream["profile"]],
+            "-pix_fmt", stream["pix_fmt"]]
+    level = stream.get("level")
+    if isinstance(level, int) and level >= 10:
+        args += ["-level:v", f"{level // 10}.{level % 10}"]
+    if not stream.get("has_b_frames"):
+        args += ["-bf", "0"]
+    for key, option in COLOR_OPTIONS:
+        value = stream.get(key)
+        if value and value != "unknown":
+            args += [option, value]
+    return args
+
+def cut_smart(video_path, start, end, output_path, keyframes, info=None):
+    """
+    Frame-accurate cut that re-encodes only [start, next keyframe) and stream-copies the
+    rest. Returns the start that was written.
+    The head is encoded with the source's H.264 parameters (matching_encode_args) and both
+    video parts are joined as MPEG-TS, so every part carries its own parameter sets; the
+    audio is copied from the source for the whole window instead of being joined, and the
+    output keeps the source's time scale. Raises RuntimeError for sources that fail
+    smart_cut_incompatibility (info defaults to the video's index), so callers re-encode.
+    """
+    if abs(keyframe_at_or_before(keyframes, start) - start) <= KEYFRAME_EPSILON:
+        return cut_copy(video_path, start, end, output_path, keyframes)
+    info = info or load_video_index(video_path).info
+    reason = smart_cut_incompatibility(info)
+    if reason:
+        raise RuntimeError(reason)
+    next_keyframe = keyframe_after(keyframes, start)
+    head_end = end if next_keyframe is None or next_keyframe >= end else next_keyframe
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(output_path) or None)
+    try:
+        head_path = os.path.join(tmp_dir, "head.ts")
+        run_ffmpeg(["-ss", f"{start:.3f}", "-i", video_path, "-t", f"{head_end - start:.3f}", "-map", "0:v:0",
+                    "-an"] + matching_encode_args(info) + ["-f", "mpegts", head_path])
+        parts = [head_path]
+        durations = [head_end - start]
+        if head_end < end:
+            tail_path = os.path.join(tmp_dir, "tail.ts")
+            run_ffmpeg(["-ss", f"{head_end:.3f}", "-i", video_path, "-t", f"{end - head_end:.3f}",
+                        "-map", "0:v:0", "-an", "-c:v", "copy", "-f", "mpegts", tail_path])
+            parts.append(tail_path)
+            durations.append(None)
+        list_path = os.path.join(tmp_dir, "parts.txt")
+        _write_concat_list(list_path, parts, durations)
+        args = ["-f", "concat", "-safe", "0", "-i", list_path,
+                "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}", "-i", video_path,
+                "-map", "0:v:0", "-map", "1:a:0?", "-c", "copy"]
+        timescale = video_timescale(info)
+        if timescale:
+            args += ["-video_track_timescale", str(timescale)]
+        run_ffmpeg(args + [output_path])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return start
+
+class VideoSource:
+    """
+    One opened source video for a cutting mode.
+    Duration, streams and keyframes come from the video's sidecar index (see video_index),
+    so copy and smart modes never probe a video twice; re-encode mode opens its MoviePy
+    VideoFileClip only for the first clip MoviePy has to encode. When ffprobe is
+    unavailable, copy/smart fall back to re-encoding and the reason is kept in fallback_reason.
+    """
+    def __init__(self, path, mode=MODE_REENCODE):
+        self.path = path
+        self.mode = mode
+        self.fallback_reason = None
+        self.duration = None
+        self.frame_rate = None
+        self.keyframes = []
+        self._clip = None
+        self._info = None
+
+    def open(self):
+        try:
+            index = load_video_index(self.path)
+        except RuntimeError as e:
+            index = None
+            if self.mode != MODE_REENCODE:
+                self.fallback_reason = str(e)
+                self.mode = MODE_REENCODE
+        if index is not None:
+            self._info = index.info
+            self.keyframes = index.keyframes
+            self.duration = index.duration
+            self.frame_rate = video_frame_rate(self._info)
+            if self.mode == MODE_SMART and smart_cut_incompatibility(self._info):
+                # The re-encoded head must match the copied tail to be concatenated.
+                self.fallback_reason = smart_cut_incompatibility(self._info)
+                self.mode = MODE_REENCODE
+            if self.duration and self.frame_rate:
+                return self
+        self._clip = VideoFileClip(self.path)
+        self.duration = self._clip.duration
+        self.frame_rate = self._clip.fps
+        return self
+
+    def cut(self, start_time, end_time, output_path):
+        """
+        Writes [start_time, end_time] to output_path and returns the actual start time
+        (earlier than requested for keyframe-snapped stream copies).
+        """
+        if self.mode == MODE_COPY:
+            return cut_copy(self.path, start_time, end_time, output_path, self.keyframes)
+        if self.mode == MODE_SMART:
+            try:
+                return cut_smart(self.path, start_time, end_time, output_path, self.keyframes, self._info)
+            except RuntimeError:
+                # Fall back to the frame-accurate path for this clip.
+                pass
+        if self._clip is None:
+            self._clip = VideoFileClip(self.path)
+        subclip = self._clip.subclip(start_time, end_time)
+        subclip.write_videofile(output_path, codec="libx264", audio_codec="aac",
+                                verbose=False, logger=None)
+        return start_time
+
+    def cut_span(self, clips):
+        """
+        Writes several clips [(start, end, output_path), ...] that lie inside one merged span.
+        Re-encode mode decodes the span a single time; the other modes do not decode, so the
+        clips are simply cut one by one. Returns the actual start time of every clip.
+        """
+        if self.mode == MODE_REENCODE and len(clips) > 1:
+            try:
+                cut_span_reencode(self.path, min(start for start, _end, _path in clips), clips)
+                return [start for start, _end, _path in clips]
+            except RuntimeError:
+                # Fall back to one MoviePy encode per clip.
+                pass
+        return [self.cut(start, end, output_path) for start, end, output_path in clips]
+
+    def close(self):
+        if self._clip is not None:
+            self._clip.close()
+            self._clip = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Cut Scheduling ---
+def plan_cut_tasks(query_output, video_files, clip_length=CLIP_LENGTH):
+    """
+    Turns query results into cut tasks grouped by source video.
+    Returns ({video_path: [task, ...]}, [missing video base names]). A task is a dict with
+    video_path, base, start, end and output_filename; requests for the exact same
+    (video, start, end) become one task whose extra file names are listed in "aliases"
+    and are copied from the cut instead of being encoded again.
+    """
+    groups = {}
+    by_window = {}
+    missing = []
+    for idx, entry in enumerate(query_output):
+        if not entry["found"]:
+            continue
+        for fname, times in entry["matches"]:
+            base = os.path.splitext(fname)[0]
+            if base not in video_files:
+                if base not in missing:
+                    missing.append(base)
+                continue
+            video_path = video_files[base]
+            for start_time in times:
+                # Milliseconds, so two hits within the same second get separate files.
+                output_filename = f"{base}_{entry['type']}_{idx}_{int(round(start_time * 1000))}.mp4"
+                window = (video_path, start_time, start_time + clip_length)
+                task = by_window.get(window)
+                if task is None:
+                    task = {"video_path": video_path, "base": base, "start": start_time,
+                            "end": start_time + clip_length, "output_filename": output_filename, "aliases": []}
+                    by_window[window] = task
+                    groups.setdefault(video_path, []).append(task)
+                elif output_filename != task["output_filename"] and output_filename not in task["aliases"]:
+                    task["aliases"].append(output_filename)
+    for tasks in groups.values():
+        tasks.sort(key=lambda task: task["start"])
+    return groups, missing
+
+def validate_cut_tasks(groups, indexes):
+    """
+    Checks the tasks against the video durations of the sidecar indexes {video_path: VideoIndex}
+    before anything is cut: windows starting past the end of their video are dropped, the
+    others end at the end of the video at the latest. Videos without an index are left as
+    they are. Returns (groups, [(base, start) of every dropped task]).
+    """
+    valid = {}
+    dropped = []
+    for video_path, tasks in groups.items():
+        index = indexes.get(video_path)
+        kept = []
+        for task in tasks:
+            window = index.clamp(task["start"], task["end"]) if index is not None else (task["start"], task["end"])
+            if window is None:
+                dropped.append((task["base"], task["start"]))
+            else:
+                task["end"] = window[1]
+                kept.append(task)
+        if kept:
+            valid[video_path] = kept
+    return valid, dropped
+
+def merge_cut_windows(tasks, gap=0.0, max_seconds=MAX_SPAN_SECONDS, max_clips=MAX_SPAN_CLIPS):
+    """
+    Coalesces the overlapping or adjacent windows of one source (tasks sorted by start)
+    into spans {"start", "end", "tasks"}; each span is decoded once.
+    A span grows to at most max_seconds and max_clips; a longer run of adjacent windows
+    is split into several spans (their overlap is decoded twice).
+    """
+    spans = []
+    for task in tasks:
+        if (spans and task["start"] <= spans[-1]["end"] + gap and len(spans[-1]["tasks"]) < max_clips
+                and max(spans[-1]["end"], task["end"]) - spans[-1]["start"] <= max_seconds):
+            span = spans[-1]
+            span["end"] = max(span["end"], task["end"])
+            span["tasks"].append(task)
+        else:
+            spans.append({"start": task["start"], "end": task["end"], "tasks": [task]})
+    return spans
+
+def plan_spans(groups, gap=0.0):
+    """
+    Merges the windows of every source group. Returns ({video_path: [span, ...]}, stats)
+    where stats reports clip and span counts and the decoded seconds the merge saves.
+    """
+    spans_by_source = {video_path: merge_cut_windows(tasks, gap) for video_path, tasks in groups.items()}
+    clip_seconds = sum(task["end"] - task["start"] for tasks in groups.values() for task in tasks)
+    span_seconds = sum(span["end"] - span["start"] for spans in spans_by_source.values() for span in spans)
+    stats = {
+        "clips": sum(len(tasks) for tasks in groups.values()),
+        "spans": sum(len(spans) for spans in spans_by_source.values()),
+        "clip_seconds": clip_seconds,
+        "span_seconds": span_seconds,
+        "saved_seconds": clip_seconds - span_seconds,
+    }
+    return spans_by_source, stats
+
+def count_outputs(spans_by_source):
+    return sum(1 + len(task["aliases"]) for spans in spans_by_source.values()
+               for span in spans for task in span["tasks"])
+
+def _split_groups(spans_by_source, max_workers):
+    """
+    Splits the per-source spans into worker batches. Sources with many spans get several
+    contiguous batches (each worker opens the source once) so all workers stay busy.
+    """
+    total = sum(len(spans) for spans in spans_by_source.values())
+    batches = []
+    for video_path, spans in spans_by_source.items():
+        parts = min(len(spans), max(1, round(max_workers * len(spans) / total)))
+        size = -(-len(spans) // parts)
+        for i in range(0, len(spans), size):
+            batches.append((video_path, spans[i:i + size]))
+    return batches
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def cut_settings(mode):
+    """
+    Settings that change the bytes of a cut clip; part of the clip cache key.
+    """
+    if mode == MODE_COPY:
+        return {"mode": mode, "video_codec": "copy", "audio_codec": "copy"}
+    if mode == MODE_SMART:
+        # "join" tells these clips from the ones cut before heads matched the source.
+        return {"mode": mode, "video_codec": "libx264-matched", "audio_codec": "copy", "join": "mpegts"}
+    return {"mode": mode, "video_codec": "libx264", "audio_codec": "aac"}
+
+class CutScheduler:
+    """
+    Runs the merged spans of every source on a bounded thread pool (max_workers
+    concurrent encodes).
+    on_progress(done, total, message) is called from the worker threads after every
+    output file and for notable events (message may be None).
+    With a ClipCache, clips cut earlier with the same source, window and settings are
+    linked from the cache instead of being cut, and new clips are added to it.
+    Setting cancel_event (a threading.Event) stops the run before the next span; clips
+    already being cut are finished and the skipped ones are counted in cancelled.
+    Every clip is written to a temporary file and renamed when complete. With a
+    CutManifest the status of every output file is persisted in the output folder, and
+    resume=True skips the clips the manifest verifies as complete (counted in resumed).
+    """
+    def __init__(self, output_dir, mode=MODE_REENCODE, max_workers=2, on_progress=None, clip_cache=None,
+                 cancel_event=None, manifest=None, resume=False):
+        self.output_dir = output_dir
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.on_progress = on_progress or (lambda done, total, message: None)
+        self.clip_cache = clip_cache
+        self.cancel_event = cancel_event
+        self.manifest = manifest
+        self.resume = resume
+        self.settings = cut_settings(mode)
+        self.cache_hits = 0
+        self.cancelled = 0
+        self.resumed = 0
+        self._lock = threading.Lock()
+        self._done = 0
+        self._total = 0
+        self.failed = 0
+
+    def _report(self, message=None, finished=0):
+        with self._lock:
+            self._done += finished
+            done = self._done
+        self.on_progress(done, self._total, message)
+
+    def _cache_key(self, fingerprint, task):
+        return self.clip_cache.key(fingerprint, task["start"], task["end"], self.settings)
+
+    def _restore_cached(self, fingerprint, spans):
+        """
+        Places every cached clip of the batch and returns the spans that still need cutting.
+        """
+        remaining = []
+        for span in spans:
+            tasks = []
+            for task in span["tasks"]:
+                output_filepath = os.path.join(self.output_dir, task["output_filename"])
+                tmp_path = temp_clip_path(output_filepath)
+                try:
+                    hit = self.clip_cache.get(self._cache_key(fingerprint, task), tmp_path)
+                    if hit:
+                        os.replace(tmp_path, output_filepath)
+                except OSError:
+                    hit = False
+                if hit:
+                    with self._lock:
+                        self.cache_hits += 1
+                    METRICS.count("clip_cache_hits")
+                    self._finish(task, task["start"], note="restored from cache")
+                else:
+                    tasks.append(task)
+            if tasks:
+                remaining.append(dict(span, tasks=tasks))
+        return remaining
+
+    def _is_cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def _skip(self, video_path, spans):
+        skipped = count_outputs({video_path: spans})
+        with self._lock:
+            self.cancelled += skipped
+        self._report(finished=skipped)
+
+    def _run_batch(self, video_path, spans):
+        if self._is_cancelled():
+            self._skip(video_path, spans)
+            return
+        fingerprint = None
+        if self.clip_cache is not None:
+            try:
+                fingerprint = self.clip_cache.fingerprint(video_path)
+                spans = self._restore_cached(fingerprint, spans)
+            except OSError:
+                fingerprint = None
+            if not spans:
+                # Everything came from the cache; the source is never opened.
+                return
+        outputs = count_outputs({video_path: spans})
+        try:
+            with METRICS.timer("open_source"):
+                source = VideoSource(video_path, self.mode).open()
+        except Exception as e:
+            with self._lock:
+                self.failed += outputs
+            for span in spans:
+                for task in span["tasks"]:
+                    self._mark_failed(task, e)
+            self._report(f"Error loading video: {video_path} - {e}", finished=outputs)
+            return
+        try:
+            if source.fallback_reason:
+                self._report(f"Re-encoding {os.path.basename(video_path)}: {source.fallback_reason}")
+            # Clips of a fallback re-encode do not match the requested settings, so they are not cached.
+            if source.mode != self.mode:
+                fingerprint = None
+            for n, span in enumerate(spans):
+                if self._is_cancelled():
+                    self._skip(video_path, spans[n:])
+                    break
+                if len(span["tasks"]) == 1:
+                    self._cut_task(source, span["tasks"][0], fingerprint)
+                else:
+                    self._cut_span(source, span, fingerprint)
+        finally:
+            source.close()
+
+    def _mark_failed(self, task, error):
+        if self.manifest is not None:
+            for filename in [task["output_filename"]] + task["aliases"]:
+                self.manifest.mark_failed(filename, error)
+
+    def _fail(self, task, error):
+        with self._lock:
+            self.failed += 1 + len(task["aliases"])
+        self._mark_failed(task, error)
+        self._report(f"Error: {task['video_path']} {task['start']} - {error}", finished=1 + len(task["aliases"]))
+
+    def _cut_task(self, source, task, fingerprint=None):
+        start_time = task["start"]
+        end_time = min(task["end"], source.duration)
+        output_filepath = os.path.join(self.output_dir, task["output_filename"])
+        tmp_path = temp_clip_path(output_filepath)
+        try:
+            with METRICS.timer("cut_clips"):
+                written_start = source.cut(start_time, end_time, tmp_path)
+            os.replace(tmp_path, output_filepath)
+        except Exception as e:
+            _remove_quietly(tmp_path)
+            self._fail(task, e)
+            return
+        self._count_frames(source, end_time - written_start, 1)
+        self._store(fingerprint, task)
+        self._finish(task, written_start)
+
+    def _cut_span(self, source, span, fingerprint=None):
+        tasks = span["tasks"]
+        output_paths = [os.path.join(self.output_dir, task["output_filename"]) for task in tasks]
+        clips = [(task["start"], min(task["end"], source.duration), temp_clip_path(output_path))
+                 for task, output_path in zip(tasks, output_paths)]
+        try:
+            with METRICS.timer("cut_clips"):
+                written_starts = source.cut_span(clips)
+            for (_start, _end, tmp_path), output_path in zip(clips, output_paths):
+                os.replace(tmp_path, output_path)
+        except Exception as e:
+            for _start, _end, tmp_path in clips:
+                _remove_quietly(tmp_path)
+            for task in tasks:
+                self._fail(task, e)
+            return
+        self._count_frames(source, sum(end - start for (_start, end, _path), start in zip(clips, written_starts)),
+                           len(clips))
+        for task, written_start in zip(tasks, written_starts):
+            self._store(fingerprint, task)
+            self._finish(task, written_start)
+
+    @staticmethod
+    def _count_frames(source, seconds, clips):
+        """
+        Counts the frames written by a cut (encoded, or copied in copy mode) for the encode fps rate.
+        """
+        METRICS.count("clips_cut", clips)
+        if source.frame_rate:
+            METRICS.count("encoded_frames", int(max(0.0, seconds) * source.frame_rate))
+
+    def _store(self, fingerprint, task):
+        if self.clip_cache is None or fingerprint is None:
+            return
+        try:
+            self.clip_cache.put(self._cache_key(fingerprint, task),
+                                os.path.join(self.output_dir, task["output_filename"]))
+        except OSError as e:
+            self._report(f"Could not cache {task['output_filename']}: {e}")
+
+    def _finish(self, task, written_start, note=None):
+        output_filepath = os.path.join(self.output_dir, task["output_filename"])
+        if note:
+            message = f"{task['output_filename']} saved ({note})."
+        elif written_start < task["start"]:
+            message = f"{task['output_filename']} saved (snapped to keyframe at {written_start:.3f}s)."
+        else:
+            message = f"{task['output_filename']} saved."
+        if self.manifest is not None:
+            self.manifest.mark_done(task["output_filename"])
+        self._report(message, finished=1)
+        for alias in task["aliases"]:
+            alias_path = os.path.join(self.output_dir, alias)
+            tmp_path = temp_clip_path(alias_path)
+            try:
+                place_file(output_filepath, tmp_path)
+                os.replace(tmp_path, alias_path)
+                if self.manifest is not None:
+                    self.manifest.mark_done(alias)
+                self._report(f"{alias} saved (duplicate of {task['output_filename']}).", finished=1)
+            except OSError as e:
+                _remove_quietly(tmp_path)
+                with self._lock:
+                    self.failed += 1
+                if self.manifest is not None:
+                    self.manifest.mark_failed(alias, e)
+                self._report(f"Error: {alias} - {e}", finished=1)
+
+    def _skip_completed(self, spans_by_source):
+        """
+        Drops the tasks whose output and duplicates the manifest verifies as complete.
+        """
+        remaining = {}
+        for video_path, spans in spans_by_source.items():
+            kept_spans = []
+            for span in spans:
+                tasks = []
+                for task in span["tasks"]:
+                    filenames = [task["output_filename"]] + task["aliases"]
+                    if all(self.manifest.is_complete(filename, task, self.settings) for filename in filenames):
+                        self.resumed += len(filenames)
+                    else:
+                        tasks.append(task)
+                if tasks:
+                    kept_spans.append(dict(span, tasks=tasks))
+            if kept_spans:
+                remaining[video_path] = kept_spans
+        return remaining
+
+    def run(self, spans_by_source):
+        """
+        Cuts every span in spans_by_source ({video_path: [span, ...]}, see plan_spans) and
+        returns the number of failed output files.
+        """
+        self._done = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.cancelled = 0
+        self.resumed = 0
+        self._total = count_outputs(spans_by_source)
+        if not spans_by_source:
+            return 0
+        if self.manifest is not None:
+            removed = remove_partial_clips(self.output_dir)
+            if removed:
+                self._report(f"Removed {removed} partial clip(s) of an interrupted job.")
+            try:
+                self.manifest.plan(spans_by_source, self.settings, keep_done=self.resume)
+            except OSError as e:
+                self._report(f"Could not write the cut manifest, the job will not be resumable: {e}")
+                self.manifest = None
+            if self.manifest is not None and self.resume:
+                spans_by_source = self._skip_completed(spans_by_source)
+                if self.resumed:
+                    self._report(f"Resuming: {self.resumed} clip(s) already complete.", finished=self.resumed)
+        batches = _split_groups(spans_by_source, self.max_workers)
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                futures = [executor.submit(self._run_batch, video_path, spans) for video_path, spans in batches]
+                for future in futures:
+                    future.result()
+        if self.manifest is not None:
+            try:
+                self.manifest.save(force=True)
+            except OSError as e:
+                self._report(f"Could not save the cut manifest: {e}")
+        if self.clip_cache is not None:
+            try:
+                self.clip_cache.save()
+            except OSError as e:
+                self._report(f"Could not save the clip cache index: {e}")
+        return self.failed
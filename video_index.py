@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+import threading
+from bisect import bisect_right
+from metrics import METRICS
+
+# --- Sidecar Video Index ---
+# A one-time ffprobe scan of a video (duration, stream parameters, keyframe timestamps and
+# their byte offsets) stored as "<video>.index.json" next to it, or in the user cache
+# folder when the video's folder is read-only. The index is valid as long as the video's
+# size and mtime are unchanged, so opening a source later costs a small JSON read instead
+# of probing the container and scanning its packets again.
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+FALLBACK_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ngram_video_cutter", "index")
+
+_memo = {}  # {(path, size, mtime_ns): VideoIndex}
+_memo_lock = threading.Lock()
+
+def sidecar_path(video_path):
+    return video_path + INDEX_SUFFIX
+
+def fallback_path(video_path):
+    digest = hashlib.sha256(os.path.abspath(video_path).encode("utf-8")).hexdigest()
+    return os.path.join(os.environ.get("NGRAM_INDEX_DIR") or FALLBACK_DIR, digest + INDEX_SUFFIX)
+
+def scan_video(video_path):
+    """
+    Probes a video once and returns the index data: duration, streams and the
+    [timestamp, byte offset] of every keyframe of the first video stream, stamped with the
+    size and mtime the scan was made for. Raises RuntimeError when ffprobe is unavailable
+    or its output cannot be read.
+    """
+    from video_cutter import probe_video, probe_keyframes
+    st = os.stat(video_path)
+    try:
+        info = probe_video(video_path)
+        keyframes = probe_keyframes(video_path)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise RuntimeError(f"Unreadable ffprobe output for {os.path.basename(video_path)}: {e}")
+    return {"version": INDEX_VERSION, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+            "duration": info["duration"], "streams": info["streams"], "keyframes": keyframes}
+
+class VideoIndex:
+    """
+    Loaded sidecar index of one video.
+    """
+    def __init__(self, path, data):
+        self.path = path
+        self.duration = data["duration"]
+        self.streams = data["streams"]
+        self.keyframes = [pts for pts, _pos in data["keyframes"]]
+        self.offsets = [pos for _pts, pos in data["keyframes"]]
+
+    @property
+    def info(self):
+        """
+        The {"duration", "streams"} dict probe_video returns.
+        """
+        return {"duration": self.duration, "streams": self.streams}
+
+    def seek_point(self, t):
+        """
+        Returns (time, byte offset) of the keyframe at or before t, i.e. where decoding of
+        the GOP containing t starts.
+        """
+        i = bisect_right(self.keyframes, t) - 1
+        if i < 0:
+            return 0.0, 0
+        return self.keyframes[i], self.offsets[i]
+
+    def clamp(self, start, end):
+        """
+        Returns (start, end) limited to the video, or None when start is past its end.
+        """
+        if self.duration and start >= self.duration:
+            return None
+        return start, min(end, self.duration) if self.duration else end
+
+def _read_index(path, st):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(data, dict) or data.get("version") != INDEX_VERSION or data.get("size") != st.st_size
+            or data.get("mtime_ns") != st.st_mtime_ns
+            or any(key not in data for key in ("duration", "streams", "keyframes"))):
+        return None
+    return data
+
+def _write_index(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_video_index(video_path):
+    """
+    Returns the VideoIndex of a video, scanning it and writing the sidecar when there is
+    no index for its current size and mtime. Raises RuntimeError when ffprobe is unavailable.
+    """
+    st = os.stat(video_path)
+    memo_key = (os.path.abspath(video_path), st.st_size, st.st_mtime_ns)
+    with _memo_lock:
+        index = _memo.get(memo_key)
+    if index is not None:
+        return index
+    data = _read_index(sidecar_path(video_path), st) or _read_index(fallback_path(video_path), st)
+    if data is None:
+        with METRICS.timer("index_video"):
+            data = scan_video(video_path)
+        try:
+            _write_index(sidecar_path(video_path), data)
+        except OSError:
+            try:
+                _write_index(fallback_path(video_path), data)
+            except OSError:
+                # Still usable for this session, it is only scanned again next time.
+                pass
+    index = VideoIndex(video_path, data)
+    with _memo_lock:
+        _memo[memo_key] = index
+    return index